@@ -1,44 +1,680 @@
+import bisect
+import csv
+import re
 import sqlite3  # Импорт встроенной библиотеки для работы с SQLite
+import threading
+from datetime import date
+import numpy as np  # Векторные вычисления для расчёта расхода по сегментам
 from PySide6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-                               QPushButton, QMessageBox, QComboBox, QTextEdit, QDateEdit)
-from PySide6.QtCore import Qt, QDate  # Импорт классов из QtCore
+                               QPushButton, QMessageBox, QComboBox, QDateEdit, QTableView, QMenu, QProgressBar,
+                               QFileDialog)
+from PySide6.QtCore import (Qt, QDate, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool,
+                            Signal)  # Импорт классов из QtCore
 from PySide6.QtGui import QFont  # Импорт класса для работы со шрифтами
 
+# Имя файла базы данных и время ожидания блокировки
+DATABASE_FILE = 'fuel_data.db'
+BUSY_TIMEOUT_SECONDS = 5.0
+
+DEFAULT_CURRENCIES = ('EUR', 'PLN')
+
+REFUELING_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vehicle_number TEXT NOT NULL,
+        fuel_date DATE NOT NULL,
+        fuel_card TEXT,
+        previous_mileage INTEGER,
+        current_mileage INTEGER NOT NULL,
+        diesel_liters REAL NOT NULL,
+        currency TEXT NOT NULL,
+        diesel_price_per_liter REAL NOT NULL,
+        total_diesel_cost REAL NOT NULL,
+        full_tank BOOLEAN NOT NULL,
+        adblue_liters REAL DEFAULT 0,
+        adblue_price_per_liter REAL DEFAULT 0,
+        total_adblue_cost REAL DEFAULT 0,
+        distance_traveled INTEGER DEFAULT 0,
+        average_fuel_consumption REAL DEFAULT 0,
+        total_cost_eur REAL,
+        total_cost_pln REAL
+    )
+'''
+
+
+# Однократная перестройка таблицы из старой схемы с CHECK(currency IN ('EUR', 'PLN')):
+# SQLite не умеет удалять ограничение, поэтому данные копируются в таблицу новой схемы
+def drop_currency_check(conn):
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'refueling_data'").fetchall()[0][0]
+    if 'CHECK' not in sql.upper():
+        return False
+    conn.execute('BEGIN')
+    conn.execute(REFUELING_TABLE_SQL.format(name='refueling_data_rebuild'))
+    conn.execute('INSERT INTO refueling_data_rebuild SELECT * FROM refueling_data')
+    conn.execute('DROP TABLE refueling_data')
+    conn.execute('ALTER TABLE refueling_data_rebuild RENAME TO refueling_data')
+    conn.commit()
+    return True
+
 
 # Функция для создания базы данных
 def create_database():
-    conn = sqlite3.connect('fuel_data.db')
+    conn = sqlite3.connect(DATABASE_FILE)
     cursor = conn.cursor()
+    cursor.execute(REFUELING_TABLE_SQL.format(name='refueling_data'))
+    drop_currency_check(conn)
+    # WAL: чтение (в том числе открытый курсор таблицы результатов) и запись не блокируют друг друга
+    cursor.execute('PRAGMA journal_mode=WAL')
+    # Справочник валют и курсы к PLN; новая валюта — строка в currencies, а не изменение схемы
+    cursor.execute('CREATE TABLE IF NOT EXISTS currencies (code TEXT PRIMARY KEY) WITHOUT ROWID')
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS refueling_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            vehicle_number TEXT NOT NULL,
-            fuel_date DATE NOT NULL,
-            fuel_card TEXT,
-            previous_mileage INTEGER,
-            current_mileage INTEGER NOT NULL,
-            diesel_liters REAL NOT NULL,
-            currency TEXT CHECK(currency IN ('EUR', 'PLN')) NOT NULL,
-            diesel_price_per_liter REAL NOT NULL,
-            total_diesel_cost REAL NOT NULL,
-            full_tank BOOLEAN NOT NULL,
-            adblue_liters REAL DEFAULT 0,
-            adblue_price_per_liter REAL DEFAULT 0,
-            total_adblue_cost REAL DEFAULT 0,
-            distance_traveled INTEGER DEFAULT 0,
-            average_fuel_consumption REAL DEFAULT 0,
-            total_cost_eur REAL DEFAULT 0,
-            total_cost_pln REAL DEFAULT 0
-        )
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            currency TEXT NOT NULL,
+            rate_date DATE NOT NULL,
+            pln_per_unit REAL NOT NULL,
+            source TEXT NOT NULL,
+            PRIMARY KEY (currency, rate_date)
+        ) WITHOUT ROWID
     ''')
+    cursor.executemany('INSERT OR IGNORE INTO currencies (code) VALUES (?)', [(code,) for code in DEFAULT_CURRENCIES])
+    cursor.execute('INSERT OR IGNORE INTO currencies (code) SELECT DISTINCT currency FROM refueling_data')
+    conn.commit()
+    # Составные индексы для поиска по машине или карте в диапазоне дат и индекс для поиска только по датам;
+    # индекс по машине включает пробег — это порядок заправок машины для поиска соседних записей
+    cursor.execute('DROP INDEX IF EXISTS idx_refueling_vehicle_date')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_refueling_vehicle_date_mileage '
+                   'ON refueling_data (vehicle_number, fuel_date, current_mileage)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_refueling_card_date ON refueling_data (fuel_card, fuel_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_refueling_date ON refueling_data (fuel_date)')
+    # Сегменты от полного бака до полного бака; при первом создании таблицы заполняются по всей истории
+    segments_exist = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fuel_segments'").fetchone()
+    cursor.execute(CREATE_FUEL_SEGMENTS_SQL)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fuel_segments_vehicle '
+                   'ON fuel_segments (vehicle_number, start_date, start_mileage)')
+    if not segments_exist:
+        recompute_all_segments(conn)
     conn.commit()
     conn.close()
 
 
+CREATE_FUEL_SEGMENTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS fuel_segments (
+        id INTEGER PRIMARY KEY,
+        vehicle_number TEXT NOT NULL,
+        start_id INTEGER NOT NULL,
+        end_id INTEGER NOT NULL UNIQUE,
+        start_date DATE NOT NULL,
+        start_mileage INTEGER NOT NULL,
+        end_date DATE NOT NULL,
+        end_mileage INTEGER NOT NULL,
+        distance INTEGER NOT NULL,
+        diesel_liters REAL NOT NULL,
+        consumption REAL NOT NULL
+    )
+'''
+
+SEGMENT_INPUT_SQL = '''
+    SELECT vehicle_number, id, fuel_date, current_mileage, diesel_liters, full_tank FROM refueling_data
+    {where} ORDER BY vehicle_number, fuel_date, current_mileage
+'''
+
+# Типы колонок SEGMENT_INPUT_SQL: строки переводятся в массив NumPy одним вызовом, без разбора по колонкам
+SEGMENT_INPUT_DTYPE = [('vehicle_number', object), ('id', np.int64), ('fuel_date', object),
+                       ('current_mileage', np.int64), ('diesel_liters', np.float64), ('full_tank', np.bool_)]
+
+INSERT_SEGMENT_SQL = '''
+    INSERT INTO fuel_segments (vehicle_number, start_id, end_id, start_date, start_mileage, end_date, end_mileage,
+                               distance, diesel_liters, consumption)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+# Расчёт сегментов по заправкам, упорядоченным по (машина, дата, пробег). Сегмент начинается после заправки
+# до полного бака и заканчивается следующей заправкой до полного бака включительно: всё топливо, залитое
+# в сегменте, израсходовано на его километраж. Группы считаются векторно, без цикла по строкам
+def compute_segments(rows):
+    if not rows:
+        return []
+    table = np.array(rows, dtype=SEGMENT_INPUT_DTYPE)
+    vehicles, ids, dates, mileage, liters, full = (table[name] for name in table.dtype.names)
+    new_vehicle = np.ones(len(ids), dtype=bool)
+    new_vehicle[1:] = vehicles[1:] != vehicles[:-1]
+    # Новая группа начинается с первой заправки машины и после каждого полного бака
+    group_start = new_vehicle.copy()
+    group_start[1:] |= full[:-1]
+    starts = np.flatnonzero(group_start)
+    ends = np.append(starts[1:], len(ids)) - 1
+    group_liters = np.add.reduceat(liters, starts)
+    # Сегмент полный, если перед ним был полный бак этой же машины и он сам закончился полным баком
+    complete = ~new_vehicle[starts] & full[ends]
+    starts, ends, group_liters = starts[complete], ends[complete], group_liters[complete]
+    openers = starts - 1
+    distance = mileage[ends] - mileage[openers]
+    consumption = np.divide(group_liters * 100, distance, out=np.zeros(len(distance)), where=distance > 0)
+    return list(zip(vehicles[ends].tolist(), ids[openers].tolist(), ids[ends].tolist(), dates[openers].tolist(),
+                    mileage[openers].tolist(), dates[ends].tolist(), mileage[ends].tolist(), distance.tolist(),
+                    group_liters.tolist(), consumption.tolist()))
+
+
+# Полный пересчёт сегментов всего парка
+def recompute_all_segments(conn):
+    segments = compute_segments(conn.execute(SEGMENT_INPUT_SQL.format(where='')).fetchall())
+    conn.execute('DELETE FROM fuel_segments')
+    conn.executemany(INSERT_SEGMENT_SQL, segments)
+    return len(segments)
+
+
+# Пересчёт только сегментов вокруг новой заправки: от ближайшего полного бака до неё
+# до ближайшего полного бака после неё
+def update_segments(conn, vehicle_number, fuel_date, current_mileage):
+    key = (vehicle_number, fuel_date, current_mileage)
+    opener = conn.execute('''
+        SELECT fuel_date, current_mileage FROM refueling_data
+        WHERE vehicle_number = ? AND full_tank AND (fuel_date, current_mileage) < (?, ?)
+        ORDER BY fuel_date DESC, current_mileage DESC LIMIT 1
+    ''', key).fetchone()
+    closer = conn.execute('''
+        SELECT fuel_date, current_mileage FROM refueling_data
+        WHERE vehicle_number = ? AND full_tank AND (fuel_date, current_mileage) > (?, ?)
+        ORDER BY fuel_date, current_mileage LIMIT 1
+    ''', key).fetchone()
+    rows_where, segments_where, parameters = ['vehicle_number = ?'], ['vehicle_number = ?'], [vehicle_number]
+    if opener is not None:
+        rows_where.append('(fuel_date, current_mileage) >= (?, ?)')
+        segments_where.append('(start_date, start_mileage) >= (?, ?)')
+        parameters.extend(opener)
+    if closer is not None:
+        rows_where.append('(fuel_date, current_mileage) <= (?, ?)')
+        segments_where.append('(end_date, end_mileage) <= (?, ?)')
+        parameters.extend(closer)
+    conn.execute(f"DELETE FROM fuel_segments WHERE {' AND '.join(segments_where)}", parameters)
+    rows = conn.execute(SEGMENT_INPUT_SQL.format(where='WHERE ' + ' AND '.join(rows_where)), parameters).fetchall()
+    conn.executemany(INSERT_SEGMENT_SQL, compute_segments(rows))
+
+
+SEARCH_COLUMNS = ('vehicle_number', 'fuel_date', 'fuel_card', 'previous_mileage', 'current_mileage',
+                  'diesel_liters', 'currency', 'diesel_price_per_liter', 'total_diesel_cost',
+                  'full_tank', 'adblue_liters', 'adblue_price_per_liter', 'total_adblue_cost',
+                  'distance_traveled', 'average_fuel_consumption', 'total_cost_eur', 'total_cost_pln',
+                  'segment_consumption')
+# Вычисляемые колонки результатов: расход сегмента, который заканчивается этой заправкой
+SEARCH_EXPRESSIONS = {
+    'segment_consumption': '(SELECT ROUND(consumption, 2) FROM fuel_segments '
+                           'WHERE end_id = refueling_data.id) AS segment_consumption',
+}
+SEARCH_HEADERS = ("Numer pojazdu", "Data tankowania", "Karta paliwowa", "Poprzedni przebieg",
+                  "Bieżący przebieg", "Ilość litrów ON", "Waluta", "Cena za litr ON", "Całkowity koszt ON",
+                  "Pełny zbiornik", "Ilość litrów AdBlue", "Cena za litr AdBlue", "Całkowity koszt AdBlue",
+                  "Przebieg", "Średnie zużycie paliwa", "Koszt całkowity EUR", "Koszt całkowity PLN",
+                  "Spalanie od pełnego baku (l/100 km)")
+# Количество строк, которые модель результатов читает из курсора за один раз
+FETCH_CHUNK_SIZE = 200
+
+
+# Построение запроса поиска: в WHERE попадают только заданные фильтры, чтобы SQLite мог выбрать индекс
+def build_search_query(vehicle_number='', fuel_card='', start_date=None, end_date=None,
+                       order_by=None, descending=False):
+    conditions = []
+    parameters = []
+    if vehicle_number:
+        conditions.append('vehicle_number = ?')
+        parameters.append(vehicle_number)
+    if fuel_card:
+        conditions.append('fuel_card = ?')
+        parameters.append(fuel_card)
+    if start_date:
+        conditions.append('fuel_date >= ?')
+        parameters.append(start_date)
+    if end_date:
+        conditions.append('fuel_date <= ?')
+        parameters.append(end_date)
+    columns = ', '.join(SEARCH_EXPRESSIONS.get(column, column) for column in SEARCH_COLUMNS)
+    query = f"SELECT {columns} FROM refueling_data"
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    if order_by:
+        if order_by not in SEARCH_COLUMNS:
+            raise ValueError(f'Unsupported sort column: {order_by}')
+        direction = 'DESC' if descending else 'ASC'
+        query += f' ORDER BY {order_by} {direction}, id {direction}'
+    return query, tuple(parameters)
+
+
+INSERT_REFUELING_SQL = '''
+    INSERT INTO refueling_data (vehicle_number, fuel_date, fuel_card, previous_mileage,
+    current_mileage, diesel_liters, currency, diesel_price_per_liter, total_diesel_cost,
+    full_tank, adblue_liters, adblue_price_per_liter, total_adblue_cost,
+    distance_traveled, average_fuel_consumption, total_cost_eur, total_cost_pln)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+MILEAGE_ERROR = 'Bieżący przebieg {current} km nie pasuje do sąsiednich tankowań ({neighbour} km)'
+
+
+# Соседние заправки машины в порядке (fuel_date, current_mileage): один спуск по индексу в каждую сторону
+def previous_refueling(conn, vehicle_number, fuel_date, current_mileage):
+    return conn.execute('''
+        SELECT id, current_mileage FROM refueling_data
+        WHERE vehicle_number = ? AND (fuel_date, current_mileage) < (?, ?)
+        ORDER BY fuel_date DESC, current_mileage DESC LIMIT 1
+    ''', (vehicle_number, fuel_date, current_mileage)).fetchone()
+
+
+def next_refueling(conn, vehicle_number, fuel_date, current_mileage):
+    return conn.execute('''
+        SELECT id, current_mileage, diesel_liters FROM refueling_data
+        WHERE vehicle_number = ? AND (fuel_date, current_mileage) > (?, ?)
+        ORDER BY fuel_date, current_mileage LIMIT 1
+    ''', (vehicle_number, fuel_date, current_mileage)).fetchone()
+
+
+# Пройденный километраж и средний расход на 100 км
+def mileage_columns(previous_mileage, current_mileage, diesel_liters):
+    distance_traveled = current_mileage - previous_mileage
+    average_fuel_consumption = (diesel_liters / distance_traveled) * 100 if distance_traveled > 0 else 0
+    return distance_traveled, average_fuel_consumption
+
+
+UNKNOWN_CURRENCY_ERROR = 'Nieznana waluta: {currency}'
+RATES_FILE_ERROR = 'Nieznany format pliku kursów: {path}'
+# Курс старше этого числа дней от даты заправки не используется
+MAX_RATE_AGE_DAYS = 10
+BACKFILL_BATCH_SIZE = 5000
+NBP_COLUMN = re.compile(r'^(\d+)([A-Z]{3})$')
+
+
+# Кэш курсов в памяти: для каждой валюты отсортированные даты и курсы, ближайший предыдущий курс — bisect
+class RateCache:
+    def __init__(self):
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def rate(self, conn, currency, on_date):
+        if currency == 'PLN':
+            return 1.0
+        with self.lock:
+            series = self.series.get(currency)
+        if series is None:
+            rows = conn.execute('SELECT rate_date, pln_per_unit FROM exchange_rates WHERE currency = ? ORDER BY rate_date',
+                                (currency,)).fetchall()
+            series = ([row[0] for row in rows], [row[1] for row in rows])
+            with self.lock:
+                self.series[currency] = series
+        dates, values = series
+        index = bisect.bisect_right(dates, on_date) - 1
+        if index < 0 or (date.fromisoformat(on_date) - date.fromisoformat(dates[index])).days > MAX_RATE_AGE_DAYS:
+            return None
+        return values[index]
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+rate_cache = RateCache()
+
+
+# Стоимость заправки в EUR и PLN по курсу на дату заправки; None, если курса ещё нет
+def convert_costs(conn, currency, fuel_date, total_cost):
+    pln_rate = rate_cache.rate(conn, currency, fuel_date)
+    total_cost_pln = round(total_cost * pln_rate, 2) if pln_rate is not None else None
+    if currency == 'EUR':
+        return round(total_cost, 2), total_cost_pln
+    eur_rate = rate_cache.rate(conn, 'EUR', fuel_date)
+    total_cost_eur = round(total_cost_pln / eur_rate, 2) if total_cost_pln is not None and eur_rate else None
+    return total_cost_eur, total_cost_pln
+
+
+def parse_decimal(text):
+    text = text.strip().replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+# Архивная таблица A NBP: «data;1USD;100HUF;...», даты YYYYMMDD, курсы в PLN за указанное число единиц
+def read_nbp_rates(rows, header):
+    columns = [(index, int(match.group(1)), match.group(2)) for index, match in
+               ((index, NBP_COLUMN.match(name.strip())) for index, name in enumerate(header)) if match]
+    for row in rows:
+        if not row or not re.fullmatch(r'\d{8}', row[0].strip()):
+            continue
+        rate_date = f'{row[0][:4]}-{row[0][4:6]}-{row[0][6:8]}'
+        for index, units, currency in columns:
+            value = parse_decimal(row[index]) if index < len(row) else None
+            if value:
+                yield currency, rate_date, value / units
+
+
+# Архив ECB eurofxref-hist.csv: «Date,USD,JPY,...», курсы — единиц валюты за 1 EUR; пересчёт к PLN через курс EUR/PLN
+def read_ecb_rates(rows, header):
+    currencies = [name.strip() for name in header]
+    pln_index = currencies.index('PLN')
+    for row in rows:
+        if not row or not row[0].strip():
+            continue
+        eur_pln = parse_decimal(row[pln_index])
+        if not eur_pln:
+            continue
+        yield 'EUR', row[0].strip(), eur_pln
+        for index, currency in enumerate(currencies[1:], start=1):
+            value = parse_decimal(row[index]) if index < len(row) else None
+            if value and currency and currency != 'PLN':
+                yield currency, row[0].strip(), eur_pln / value
+
+
+# Загрузка курсов из CSV NBP или ECB (выполняется в потоке записи); новые валюты попадают в справочник
+def load_rates_file(conn, path):
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as file:
+        sample = file.readline()
+        file.seek(0)
+        rows = csv.reader(file, delimiter=';' if ';' in sample else ',')
+        header = next(rows, [])
+        first = header[0].strip().lower() if header else ''
+        if first == 'data':
+            rates, source = read_nbp_rates(rows, header), 'NBP'
+        elif first == 'date' and 'PLN' in (name.strip() for name in header):
+            rates, source = read_ecb_rates(rows, header), 'ECB'
+        else:
+            raise ValueError(RATES_FILE_ERROR.format(path=path))
+        count = 0
+        for batch in iter(lambda: [rate for _, rate in zip(range(BACKFILL_BATCH_SIZE), rates)], []):
+            conn.executemany('INSERT OR IGNORE INTO currencies (code) VALUES (?)', {(rate[0],) for rate in batch})
+            conn.executemany('''
+                INSERT INTO exchange_rates (currency, rate_date, pln_per_unit, source) VALUES (?, ?, ?, ?)
+                ON CONFLICT (currency, rate_date) DO UPDATE SET pln_per_unit = excluded.pln_per_unit,
+                                                                source = excluded.source
+            ''', [(*rate, source) for rate in batch])
+            count += len(batch)
+    rate_cache.clear()
+    return count
+
+
+def load_currencies(conn):
+    return [row[0] for row in conn.execute('SELECT code FROM currencies ORDER BY code')]
+
+
+# Одна порция пересчёта старых записей (отдельная транзакция в потоке записи, порции идут по id).
+# Возвращает (последний id порции или None в конце, число заполненных строк)
+def backfill_costs_batch(conn, after_id=0, batch_size=BACKFILL_BATCH_SIZE):
+    rows = conn.execute('''
+        SELECT id, currency, fuel_date, total_diesel_cost + COALESCE(total_adblue_cost, 0) FROM refueling_data
+        WHERE id > ? AND (total_cost_pln IS NULL OR total_cost_pln = 0 OR total_cost_eur IS NULL OR total_cost_eur = 0)
+        ORDER BY id LIMIT ?
+    ''', (after_id, batch_size)).fetchall()
+    if not rows:
+        return None, 0
+    updates = [(*convert_costs(conn, currency, fuel_date, total), row_id)
+               for row_id, currency, fuel_date, total in rows]
+    updates = [update for update in updates if update[1] is not None]
+    conn.executemany('UPDATE refueling_data SET total_cost_eur = ?, total_cost_pln = ? WHERE id = ?', updates)
+    return rows[-1][0], len(updates)
+
+
+# Сохранение заправки (выполняется в потоке записи). previous_mileage берётся из предыдущей по времени
+# заправки машины; введённое вручную значение используется только для первой заправки. При заправке
+# задним числом пересчитывается только следующая за ней запись
+def insert_refueling(conn, record):
+    vehicle_number, fuel_date = record['vehicle_number'], record['fuel_date']
+    current_mileage = record['current_mileage']
+    previous = previous_refueling(conn, vehicle_number, fuel_date, current_mileage)
+    following = next_refueling(conn, vehicle_number, fuel_date, current_mileage)
+    if previous is not None and previous[1] > current_mileage:
+        raise ValueError(MILEAGE_ERROR.format(current=current_mileage, neighbour=previous[1]))
+    if following is not None and following[1] < current_mileage:
+        raise ValueError(MILEAGE_ERROR.format(current=current_mileage, neighbour=following[1]))
+    if previous is not None:
+        previous_mileage = previous[1]
+    elif record['previous_mileage'] is not None:
+        previous_mileage = record['previous_mileage']
+    else:
+        previous_mileage = current_mileage
+    distance_traveled, average_fuel_consumption = mileage_columns(previous_mileage, current_mileage,
+                                                                  record['diesel_liters'])
+    if not conn.execute('SELECT 1 FROM currencies WHERE code = ?', (record['currency'],)).fetchone():
+        raise ValueError(UNKNOWN_CURRENCY_ERROR.format(currency=record['currency']))
+    total_cost_eur, total_cost_pln = convert_costs(conn, record['currency'], fuel_date,
+                                                   record['total_diesel_cost'] + record['total_adblue_cost'])
+    row_id = conn.execute(INSERT_REFUELING_SQL, (
+        vehicle_number, fuel_date, record['fuel_card'], previous_mileage, current_mileage,
+        record['diesel_liters'], record['currency'], record['diesel_price_per_liter'],
+        record['total_diesel_cost'], record['full_tank'], record['adblue_liters'],
+        record['adblue_price_per_liter'], record['total_adblue_cost'],
+        distance_traveled, average_fuel_consumption, total_cost_eur, total_cost_pln)).lastrowid
+    if following is not None:
+        following_id, following_mileage, following_liters = following
+        conn.execute('''
+            UPDATE refueling_data SET previous_mileage = ?, distance_traveled = ?, average_fuel_consumption = ?
+            WHERE id = ?
+        ''', (current_mileage, *mileage_columns(current_mileage, following_mileage, following_liters), following_id))
+    update_segments(conn, vehicle_number, fuel_date, current_mileage)
+    return row_id
+
+
+# Открытие курсора поиска и чтение первой порции (выполняется в потоке чтения); прежний курсор закрывается
+def open_search_cursor(conn, previous_cursor, query, parameters):
+    if previous_cursor is not None:
+        previous_cursor.close()
+    cursor = conn.execute(query, parameters)
+    return cursor, cursor.fetchmany(FETCH_CHUNK_SIZE)
+
+
+def fetch_search_rows(conn, cursor):
+    return cursor.fetchmany(FETCH_CHUNK_SIZE)
+
+
+def close_search_cursor(conn, cursor):
+    cursor.close()
+
+
+class WorkerSignals(QObject):
+    done = Signal(object, object, bool)
+
+
+# Задача для пула потоков: результат или исключение возвращается сигналом в поток интерфейса
+class DatabaseTask(QRunnable):
+    def __init__(self, func, on_success=None, on_error=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.func = func
+        self.on_success = on_success
+        self.on_error = on_error
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.func()
+        except Exception as error:
+            self.signals.done.emit(self, error, False)
+        else:
+            self.signals.done.emit(self, result, True)
+
+
+# Работа с базой вне потока интерфейса: по одному потоку и одному соединению для чтения и для записи.
+# Благодаря WAL запись не ждёт чтения, а чтение не ждёт записи
+class DatabaseExecutor(QObject):
+    busy_changed = Signal(bool)
+
+    def __init__(self, database_file=DATABASE_FILE, parent=None):
+        super().__init__(parent)
+        self.database_file = database_file
+        self.connections = {}
+        self.pools = {}
+        self.tasks = set()
+        for role in ('read', 'write'):
+            pool = QThreadPool(self)
+            pool.setMaxThreadCount(1)
+            self.pools[role] = pool
+
+    # Соединение роли; используется только задачами этой роли, которые выполняются строго по очереди
+    def connection(self, role):
+        if role not in self.connections:
+            self.connections[role] = sqlite3.connect(self.database_file, timeout=BUSY_TIMEOUT_SECONDS,
+                                                     check_same_thread=False)
+        return self.connections[role]
+
+    def submit(self, role, func, *args, on_success=None, on_error=None):
+        def work():
+            conn = self.connection(role)
+            if role == 'write':
+                with conn:
+                    return func(conn, *args)
+            return func(conn, *args)
+
+        task = DatabaseTask(work, on_success, on_error)
+        task.signals.done.connect(self.finish)
+        self.tasks.add(task)
+        if len(self.tasks) == 1:
+            self.busy_changed.emit(True)
+        self.pools[role].start(task)
+
+    def read(self, func, *args, **callbacks):
+        self.submit('read', func, *args, **callbacks)
+
+    def write(self, func, *args, **callbacks):
+        self.submit('write', func, *args, **callbacks)
+
+    # Прерывание выполняющегося запроса чтения (например, устаревшего поиска)
+    def interrupt_reads(self):
+        conn = self.connections.get('read')
+        if conn is not None:
+            conn.interrupt()
+
+    def finish(self, task, result, ok):
+        self.tasks.discard(task)
+        callback = task.on_success if ok else task.on_error
+        if callback is not None:
+            callback(result)
+        if not self.tasks:
+            self.busy_changed.emit(False)
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.waitForDone()
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+
+# Модель результатов поиска: строки читаются из открытого курсора порциями, когда таблица до них прокручена,
+# сортировка выполняется в SQL повторным запросом. Все запросы идут через DatabaseExecutor, а ответы
+# устаревшего поиска (номер поколения не совпадает) отбрасываются
+class RefuelingTableModel(QAbstractTableModel):
+    search_finished = Signal(int)
+    search_failed = Signal(object)
+
+    def __init__(self, executor, parent=None):
+        super().__init__(parent)
+        self.executor = executor
+        self.rows = []
+        self.filters = None
+        self.sort_column = SEARCH_COLUMNS.index('fuel_date')
+        self.descending = False
+        self.cursor = None
+        self.fetching = False
+        self.generation = 0
+
+    def search(self, vehicle_number, fuel_card, start_date, end_date):
+        self.filters = (vehicle_number, fuel_card, start_date, end_date)
+        self.reload()
+
+    def reload(self):
+        self.cancel()
+        self.beginResetModel()
+        self.rows = []
+        self.endResetModel()
+        query, parameters = build_search_query(*self.filters, SEARCH_COLUMNS[self.sort_column], self.descending)
+        generation = self.generation
+        self.fetching = True
+        self.executor.read(open_search_cursor, self.cursor, query, parameters,
+                           on_success=lambda result: self.loaded(generation, *result),
+                           on_error=lambda error: self.failed(generation, error))
+        self.cursor = None
+
+    # Отмена текущего поиска: выполняющийся запрос прерывается, его результат будет отброшен.
+    # Вызывается только при запуске нового поиска или сортировки (reload), а не при вводе в фильтры,
+    # иначе прерванная догрузка молча обрезала бы показанную таблицу
+    def cancel(self):
+        self.generation += 1
+        if self.fetching:
+            self.fetching = False
+            self.executor.interrupt_reads()
+
+    def loaded(self, generation, cursor, rows):
+        if generation != self.generation:
+            self.executor.read(close_search_cursor, cursor)
+            return
+        self.append_rows(cursor, rows)
+        self.search_finished.emit(len(self.rows))
+
+    def failed(self, generation, error):
+        if generation != self.generation:
+            return
+        self.fetching = False
+        if isinstance(error, sqlite3.OperationalError) and 'interrupt' in str(error):
+            # Прерывание предназначалось предыдущему запросу, но попало в этот — повторяем поиск
+            self.reload()
+            return
+        self.search_failed.emit(error)
+
+    # Добавление порции в таблицу; неполная порция означает, что результат прочитан до конца
+    def append_rows(self, cursor, rows):
+        self.fetching = False
+        self.cursor = cursor if len(rows) == FETCH_CHUNK_SIZE else None
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(SEARCH_COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self.rows[index.row()][index.column()]
+        return '' if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return SEARCH_HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.cursor is not None and not self.fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        generation = self.generation
+        cursor = self.cursor
+        self.fetching = True
+        self.executor.read(fetch_search_rows, cursor,
+                           on_success=lambda rows: self.fetched(generation, cursor, rows),
+                           on_error=lambda error: self.failed(generation, error))
+
+    def fetched(self, generation, cursor, rows):
+        if generation == self.generation:
+            self.append_rows(cursor, rows)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.descending = order == Qt.DescendingOrder
+        if self.filters is not None:
+            self.reload()
+
+
 class FuelApp(QWidget):
     def __init__(self):
         super().__init__()
         self.is_dark_theme = False
+        self.executor = DatabaseExecutor(parent=self)
         self.initUI()
 
     def initUI(self):
@@ -50,6 +686,13 @@ class FuelApp(QWidget):
         self.toggle_theme_button.clicked.connect(self.toggle_theme)
         main_layout.addWidget(self.toggle_theme_button)
 
+        # Индикатор выполнения запросов к базе
+        self.busy_indicator = QProgressBar()
+        self.busy_indicator.setRange(0, 0)
+        self.busy_indicator.setVisible(False)
+        self.executor.busy_changed.connect(self.busy_indicator.setVisible)
+        main_layout.addWidget(self.busy_indicator)
+
         # Создание колонки с полями для ввода данных
         input_layout = QVBoxLayout()
         input_layout.addWidget(QLabel("Numer pojazdu"))
@@ -67,6 +710,7 @@ class FuelApp(QWidget):
 
         input_layout.addWidget(QLabel("Poprzedni przebieg"))
         self.previous_mileage_input = QLineEdit()
+        self.previous_mileage_input.setPlaceholderText("automatycznie z poprzedniego tankowania")
         input_layout.addWidget(self.previous_mileage_input)
 
         input_layout.addWidget(QLabel("Bieżący przebieg"))
@@ -79,7 +723,8 @@ class FuelApp(QWidget):
 
         input_layout.addWidget(QLabel("Waluta"))
         self.currency_dropdown = QComboBox()
-        self.currency_dropdown.addItems(["EUR", "PLN"])
+        self.currency_dropdown.addItems(list(DEFAULT_CURRENCIES))
+        self.executor.read(load_currencies, on_success=self.set_currencies)
         input_layout.addWidget(self.currency_dropdown)
 
         input_layout.addWidget(QLabel("Ilość litrów Diesel"))
@@ -129,6 +774,14 @@ class FuelApp(QWidget):
         search_button.clicked.connect(self.search_data)
         filter_layout.addWidget(search_button)
 
+        # Курсы валют и пересчёт стоимости в EUR/PLN для старых записей
+        load_rates_button = QPushButton("Wczytaj kursy walut (NBP/ECB CSV)")
+        load_rates_button.clicked.connect(self.load_rates)
+        filter_layout.addWidget(load_rates_button)
+        backfill_button = QPushButton("Przelicz koszty EUR/PLN")
+        backfill_button.clicked.connect(self.backfill_costs)
+        filter_layout.addWidget(backfill_button)
+
         # Горизонтальный макет для колонок
         columns_layout = QHBoxLayout()
         columns_layout.addLayout(input_layout)
@@ -139,10 +792,22 @@ class FuelApp(QWidget):
 
         # Поле для вывода информации
         main_layout.addWidget(QLabel("Wyniki wyszukiwania:"))
-        self.output_text = QTextEdit()
-        self.output_text.setReadOnly(True)
-        self.output_text.setStyleSheet("border: 2px solid red; padding: 5px;")
-        main_layout.addWidget(self.output_text)
+        self.results_model = RefuelingTableModel(self.executor, self)
+        self.results_model.search_finished.connect(self.show_search_result)
+        self.results_model.search_failed.connect(lambda error: QMessageBox.critical(self, "Błąd bazy danych", str(error)))
+        self.results_table = QTableView()
+        self.results_table.setModel(self.results_model)
+        self.results_table.setStyleSheet("border: 2px solid red; padding: 5px;")
+        font = QFont()
+        font.setPointSize(14)  # Установка размера шрифта
+        self.results_table.setFont(font)
+        # Сортировка по клику на заголовок (в SQL), меню заголовка — скрытие и показ колонок
+        header = self.results_table.horizontalHeader()
+        header.setSortIndicator(self.results_model.sort_column, Qt.AscendingOrder)
+        self.results_table.setSortingEnabled(True)
+        header.setContextMenuPolicy(Qt.CustomContextMenu)
+        header.customContextMenuRequested.connect(self.show_column_menu)
+        main_layout.addWidget(self.results_table)
 
         # Установка основного макета
         self.setLayout(main_layout)
@@ -171,63 +836,60 @@ class FuelApp(QWidget):
             QLabel, QLineEdit, QComboBox, QPushButton, QTextEdit, QDateEdit { color: white; }
         """)
 
-    # Функция поиска данных
+    # Функция поиска данных (запрос выполняется в фоне, строки появляются в таблице по мере чтения)
     def search_data(self):
-        try:
-            vehicle_number = self.vehicle_number_filter.text()
-            fuel_card = self.fuel_card_filter.text()
-            start_date = self.start_date_filter.date().toString("yyyy-MM-dd")
-            end_date = self.end_date_filter.date().toString("yyyy-MM-dd")
-
-            query = '''
-                    SELECT vehicle_number, fuel_date, fuel_card, previous_mileage, current_mileage,
-                       diesel_liters, currency, diesel_price_per_liter, total_diesel_cost,
-                       full_tank, adblue_liters, adblue_price_per_liter, total_adblue_cost,
-                       distance_traveled, average_fuel_consumption, total_cost_eur, total_cost_pln
-                FROM refueling_data
-                WHERE (vehicle_number = ? OR ? = '')
-                  AND (fuel_card = ? OR ? = '')
-                  AND (fuel_date BETWEEN ? AND ?)
-                '''
-            parameters = (vehicle_number, vehicle_number, fuel_card, fuel_card, start_date, end_date)
-
-            conn = sqlite3.connect('fuel_data.db')
-            cursor = conn.cursor()
-            cursor.execute(query, parameters)
-            results = cursor.fetchall()
-            conn.close()
-
-            if results:
-                output_text = ""
-                for row in results:
-                    output_text += (
-                        f"Numer pojazdu: {row[0]}, "
-                        f"Data tankowania: {row[1]}, "
-                        f"Karta paliwowa: {row[2]}, "
-                        f"Poprzedni przebieg: {row[3]}, "
-                        f"Bieżący przebieg: {row[4]}, "
-                        f"Ilość litrów ON: {row[5]}, "
-                        f"Waluta: {row[6]}, "
-                        f"Cena za litr ON: {row[7]}, "
-                        f"Całkowity koszt ON: {row[8]}, "
-                        f"Pełny zbiornik: {row[9]}, "
-                        f"Ilość litrów AdBlue: {row[10]}, "
-                        f"Cena za litr AdBlue: {row[11]}, "
-                        f"Całkowity koszt AdBlue: {row[12]}, "
-                        f"Przebieg: {row[13]}, "
-                        f"Średnie zużycie paliwa: {row[14]}\n "
-                        "------------------------------------------------------------------------------------------------------------\n"
-                    )
-                self.output_text.setPlainText(output_text)
-
-                # Изменение шрифта и его размера
-                font = QFont()
-                font.setPointSize(14)  # Установка размера шрифта
-                self.output_text.setFont(font)  # Применение шрифта к QPlainTextEdit
+        vehicle_number = self.vehicle_number_filter.text()
+        fuel_card = self.fuel_card_filter.text()
+        start_date = self.start_date_filter.date().toString("yyyy-MM-dd")
+        end_date = self.end_date_filter.date().toString("yyyy-MM-dd")
+        self.results_model.search(vehicle_number, fuel_card, start_date, end_date)
+
+    def show_search_result(self, count):
+        if not count:
+            QMessageBox.information(self, "Wyniki wyszukiwania", "Nie znaleziono danych.")
+
+    # Меню заголовка таблицы: флажок для каждой колонки
+    def show_column_menu(self, position):
+        header = self.results_table.horizontalHeader()
+        menu = QMenu(self)
+        for column, title in enumerate(SEARCH_HEADERS):
+            action = menu.addAction(title)
+            action.setCheckable(True)
+            action.setChecked(not self.results_table.isColumnHidden(column))
+            action.toggled.connect(lambda visible, column=column: self.results_table.setColumnHidden(column, not visible))
+        menu.exec(header.mapToGlobal(position))
+
+    # Список валют из справочника; выбранная валюта сохраняется
+    def set_currencies(self, currencies):
+        selected = self.currency_dropdown.currentText()
+        self.currency_dropdown.clear()
+        self.currency_dropdown.addItems(currencies)
+        if selected in currencies:
+            self.currency_dropdown.setCurrentText(selected)
+
+    def load_rates(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Plik kursów walut", "", "CSV (*.csv)")
+        if not path:
+            return
+        self.executor.write(load_rates_file, path, on_success=self.rates_loaded,
+                            on_error=lambda error: QMessageBox.critical(self, "Błąd", str(error)))
+
+    def rates_loaded(self, count):
+        QMessageBox.information(self, "Kursy walut", "Wczytano kursów: {count}".format(count=count))
+        self.executor.read(load_currencies, on_success=self.set_currencies)
+        self.backfill_costs()
+
+    # Пересчёт порциями: каждая порция — отдельная задача записи, между ними успевают сохраняться новые заправки
+    def backfill_costs(self, after_id=0, updated=0):
+        def batch_done(result):
+            last_id, count = result
+            if last_id is None:
+                QMessageBox.information(self, "Koszty EUR/PLN", "Przeliczono wierszy: {count}".format(count=updated))
             else:
-                QMessageBox.information(self, "Wyniki wyszukiwania", "Nie znaleziono danych.")
-        except sqlite3.Error as e:
-            QMessageBox.critical(self, "Błąd bazy danych", str(e))
+                self.backfill_costs(last_id, updated + count)
+
+        self.executor.write(backfill_costs_batch, after_id, on_success=batch_done,
+                            on_error=lambda error: QMessageBox.critical(self, "Błąd", str(error)))
 
     # Функция для вычисления и сохранения данных
     def calculate_and_save_data(self):
@@ -235,42 +897,37 @@ class FuelApp(QWidget):
             vehicle_number = self.vehicle_number_input.text()
             fuel_date = self.fuel_date_input.date().toString("yyyy-MM-dd")
             fuel_card = self.fuel_card_input.text()
-            previous_mileage = int(self.previous_mileage_input.text())
+            previous_mileage = int(self.previous_mileage_input.text()) if self.previous_mileage_input.text() else None
             current_mileage = int(self.current_mileage_input.text())
             diesel_liters = float(self.diesel_liters_input.text())
             currency = self.currency_dropdown.currentText()
             diesel_price_per_liter = float(self.diesel_price_per_liter_input.text())
-            full_tank = self.full_tank_input.currentText() == "Да"
+            full_tank = self.full_tank_input.currentIndex() == 0  # первый пункт — «да»
             adblue_liters = float(self.adblue_liters_input.text()) if self.adblue_liters_input.text() else 0
             adblue_price_per_liter = float(self.adblue_price_per_liter_input.text()) if self.adblue_price_per_liter_input.text() else 0
 
             total_diesel_cost = diesel_liters * diesel_price_per_liter
             total_adblue_cost = adblue_liters * adblue_price_per_liter
 
-            # Пройденный километраж
-            distance_traveled = current_mileage - previous_mileage
-            average_fuel_consumption = (diesel_liters / distance_traveled) * 100 if distance_traveled > 0 else 0
-
-            # Сохранение данных в базу данных
-            conn = sqlite3.connect('fuel_data.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO refueling_data (vehicle_number, fuel_date, fuel_card, previous_mileage,
-                current_mileage, diesel_liters, currency, diesel_price_per_liter, total_diesel_cost,
-                full_tank, adblue_liters, adblue_price_per_liter, total_adblue_cost,
-                distance_traveled, average_fuel_consumption)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (vehicle_number, fuel_date, fuel_card, previous_mileage, current_mileage,
-                  diesel_liters, currency, diesel_price_per_liter, total_diesel_cost, full_tank,
-                  adblue_liters, adblue_price_per_liter, total_adblue_cost,
-                  distance_traveled, average_fuel_consumption))
-            conn.commit()
-            conn.close()
-
-            QMessageBox.information(self, "Sukces", "Dane zostały zapisane pomyślnie.")
-            self.clear_inputs()
-        except (ValueError, sqlite3.Error) as e:
+            record = {
+                'vehicle_number': vehicle_number, 'fuel_date': fuel_date, 'fuel_card': fuel_card,
+                'previous_mileage': previous_mileage, 'current_mileage': current_mileage,
+                'diesel_liters': diesel_liters, 'currency': currency,
+                'diesel_price_per_liter': diesel_price_per_liter, 'total_diesel_cost': total_diesel_cost,
+                'full_tank': full_tank, 'adblue_liters': adblue_liters,
+                'adblue_price_per_liter': adblue_price_per_liter, 'total_adblue_cost': total_adblue_cost,
+            }
+        except ValueError as e:
             QMessageBox.critical(self, "Błąd", str(e))
+            return
+
+        # Сохранение данных в базу данных в потоке записи
+        self.executor.write(insert_refueling, record, on_success=self.data_saved,
+                            on_error=lambda error: QMessageBox.critical(self, "Błąd", str(error)))
+
+    def data_saved(self, _):
+        QMessageBox.information(self, "Sukces", "Dane zostały zapisane pomyślnie.")
+        self.clear_inputs()
 
     # Функция очистки полей ввода
     def clear_inputs(self):
@@ -285,6 +942,11 @@ class FuelApp(QWidget):
         self.adblue_liters_input.clear()
         self.adblue_price_per_liter_input.clear()
 
+    # Перед закрытием окна дожидаемся фоновых запросов и закрываем соединения
+    def closeEvent(self, event):
+        self.executor.close()
+        super().closeEvent(event)
+
 
 if __name__ == '__main__':
     create_database()  # Создание базы данных
@@ -1,20 +1,45 @@
 import flet as ft
+import argparse
+import base64
+import bisect
+import csv
+import hashlib
+import heapq
+import io
+import json
+import logging
+import logging.handlers
+import mimetypes
+import os
+import queue
+import random
+import re
+import shutil
 import sqlite3
-from datetime import datetime
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import islice
 
 # Имя файла для базы данных
 DATABASE_FILE = "data_base.db"
 
-# Функция для подключения к базе данных SQLite
-def connect_db():
-    conn = sqlite3.connect(DATABASE_FILE)
-    cursor = conn.cursor()
-    return conn, cursor
+# Параметры пула соединений и настройки SQLite
+POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 128
+BUSY_TIMEOUT_SECONDS = 5.0
+WRITE_RETRIES = 5
+WRITE_RETRY_BASE_DELAY = 0.05
+CACHE_SIZE_KIB = 16384
+MMAP_SIZE = 256 * 1024 * 1024
 
-# Инициализация базы данных
-def init_db():
-    conn, cursor = connect_db()
-    cursor.execute('''
+# SQL-запросы держим константами, чтобы sqlite3 переиспользовал подготовленные выражения
+CREATE_VEHICLES_SQL = '''
     CREATE TABLE IF NOT EXISTS vehicles (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         vehicle_number TEXT UNIQUE NOT NULL,
@@ -23,9 +48,8 @@ def init_db():
         inspection_expiry TEXT NOT NULL,
         tachograph_calibration TEXT NOT NULL
     )
-    ''')
-
-    cursor.execute('''
+    '''
+CREATE_TRAILERS_SQL = '''
     CREATE TABLE IF NOT EXISTS trailers (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         trailer_number TEXT UNIQUE NOT NULL,
@@ -33,10 +57,701 @@ def init_db():
         trailer_insurance_expiry TEXT NOT NULL,
         trailer_inspection_expiry TEXT NOT NULL
     )
-    ''')
+    '''
+SELECT_VEHICLE_SQL = "SELECT * FROM vehicles WHERE plate_key = ?"
+SELECT_TRAILER_SQL = "SELECT * FROM trailers WHERE plate_key = ?"
+
+# Канонический ключ номера: верхний регистр без разделителей ("wgm-1234" -> "WGM1234").
+# SQLite upper() меняет только ASCII, поэтому normalize_plate() делает то же самое
+PLATE_SEPARATORS = " -./"
+PLATE_KEY_SQL = "upper(replace(replace(replace(replace({}, ' ', ''), '-', ''), '.', ''), '/', ''))"
+PLATE_SEARCH_LIMIT = 20
+PLATE_SEARCH_DEBOUNCE_SECONDS = 0.25
+
+# Колонки с датами окончания сроков; даты хранятся как YYYY-MM-DD, чтобы сравнение строк совпадало с сравнением дат
+DATE_COLUMNS = {
+    "vehicles": ("insurance_expiry", "inspection_expiry", "tachograph_calibration"),
+    "trailers": ("trailer_insurance_expiry", "trailer_inspection_expiry"),
+}
+# Виды событий по типам активов: тип -> (таблица, колонка номера, {вид события: колонка даты})
+ASSET_TABLES = {
+    "vehicle": ("vehicles", "vehicle_number", {"insurance": "insurance_expiry",
+                                              "inspection": "inspection_expiry",
+                                              "tachograph": "tachograph_calibration"}),
+    "trailer": ("trailers", "trailer_number", {"insurance": "trailer_insurance_expiry",
+                                              "inspection": "trailer_inspection_expiry"}),
+}
+
+# Колонки активов для сохранения и импорта: тип актива -> колонки таблицы в порядке вставки
+ASSET_COLUMNS = {
+    "vehicle": ("vehicle_number", "insurance_number", "insurance_expiry", "inspection_expiry",
+                "tachograph_calibration"),
+    "trailer": ("trailer_number", "trailer_insurance_number", "trailer_insurance_expiry",
+                "trailer_inspection_expiry"),
+}
+CREATE_COMPLIANCE_EVENTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS compliance_events (
+        id INTEGER PRIMARY KEY,
+        asset_type TEXT NOT NULL,
+        asset_number TEXT NOT NULL,
+        event_kind TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        UNIQUE (asset_type, asset_number, event_kind)
+    )
+    '''
+# Постраничный вывод событий: колонки строки и колонки, по которым сортирует база
+EVENT_PAGE_COLUMNS = ("id", "asset_type", "asset_number", "event_kind", "due_date")
+EVENT_SORT_COLUMNS = ("due_date", "asset_type", "asset_number", "event_kind")
+RESULTS_PAGE_SIZE = 100
+ASSET_TYPE_LABELS = {"vehicle": "Pojazd", "trailer": "Przyczepa"}
+EVENT_KIND_LABELS = {"insurance": "Ubezpieczenie", "inspection": "Przegląd", "tachograph": "Kalibracja tachografu"}
+MIGRATION_BATCH_SIZE = 5000
+CREATE_INVALID_DATES_SQL = '''
+    CREATE TABLE IF NOT EXISTS invalid_dates (
+        id INTEGER PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        column_name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        UNIQUE (table_name, row_id, column_name)
+    )
+    '''
+CREATE_DUPLICATE_PLATES_SQL = '''
+    CREATE TABLE IF NOT EXISTS duplicate_plates (
+        id INTEGER PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        kept_id INTEGER NOT NULL,
+        asset_number TEXT NOT NULL,
+        row_data TEXT NOT NULL,
+        UNIQUE (table_name, row_id)
+    )
+    '''
+
+
+# Инструментирование запросов: время, число строк, отпечаток запроса и план для медленных запросов
+QUERY_INSTRUMENTATION = True
+SLOW_QUERY_MS = 50.0
+SLOW_QUERY_LOG_FILE = "slow_queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+EXPLAINABLE_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+_FINGERPRINT_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?+)"),
+    (re.compile(r"\s+"), " "),
+]
+
+# Отпечаток запроса: литералы заменены на ?, списки IN (?, ?, ...) свёрнуты, пробелы нормализованы
+@lru_cache(maxsize=1024)
+def fingerprint_sql(sql):
+    for pattern, replacement in _FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+# Статистика по отпечаткам запросов с гистограммой времени и журналом медленных запросов
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow_log = None
+
+    def record(self, conn, sql, parameters, seconds, rows):
+        fingerprint = fingerprint_sql(sql)
+        milliseconds = seconds * 1000
+        with self._lock:
+            stats = self._statements.get(fingerprint)
+            if stats is None:
+                stats = self._statements[fingerprint] = {
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                    "histogram": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+                }
+            stats["count"] += 1
+            stats["total_ms"] += milliseconds
+            stats["max_ms"] = max(stats["max_ms"], milliseconds)
+            stats["rows"] += rows
+            stats["histogram"][bisect.bisect_left(HISTOGRAM_BUCKETS_MS, milliseconds)] += 1
+        if milliseconds >= SLOW_QUERY_MS:
+            self._log_slow_query(conn, sql, parameters, fingerprint, milliseconds, rows)
+
+    def _log_slow_query(self, conn, sql, parameters, fingerprint, milliseconds, rows):
+        plan = ""
+        if sql.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS):
+            try:
+                # Базовый Connection.execute, чтобы EXPLAIN не попадал в статистику
+                plan = "; ".join(row[3] for row in sqlite3.Connection.execute(
+                    conn, "EXPLAIN QUERY PLAN " + sql, parameters))
+            except sqlite3.Error:
+                pass
+        self._logger().warning("%.1f ms, %d rows: %s | plan: %s", milliseconds, rows, fingerprint, plan)
+
+    def _logger(self):
+        with self._lock:
+            if self._slow_log is None:
+                self._slow_log = logging.getLogger("fleet.slow_queries")
+                self._slow_log.propagate = False
+                handler = logging.handlers.RotatingFileHandler(
+                    SLOW_QUERY_LOG_FILE, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS,
+                    encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                self._slow_log.addHandler(handler)
+            return self._slow_log
+
+    # Статистика, отсортированная по суммарному времени
+    def snapshot(self):
+        with self._lock:
+            statements = [(fingerprint, dict(stats, histogram=list(stats["histogram"])))
+                          for fingerprint, stats in self._statements.items()]
+        return sorted(statements, key=lambda item: item[1]["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+query_stats = QueryStats()
+
+# Гистограмма в виде строки: "≤1ms:120 ≤2ms:4 >1000ms:1"
+def format_histogram(histogram):
+    labels = [f"≤{bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+    return " ".join(f"{label}:{count}" for label, count in zip(labels, histogram) if count)
+
+# Курсор, который измеряет время выполнения и выборки строк каждого запроса
+class InstrumentedCursor(sqlite3.Cursor):
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            query_stats.record(self.connection, sql, parameters, elapsed, max(self.rowcount, 0))
+        else:
+            # Для SELECT учитывается и время выборки строк, запись — после исчерпания курсора
+            self._pending = [sql, parameters, elapsed, 0]
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        first_parameters = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else ()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        query_stats.record(self.connection, sql, first_parameters, time.perf_counter() - started, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None, True)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _fetched(self, started, rows, done):
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - started
+            self._pending[3] += rows
+            if done:
+                self._finish()
+
+    def _finish(self):
+        if self._pending is not None:
+            sql, parameters, elapsed, rows = self._pending
+            self._pending = None
+            query_stats.record(self.connection, sql, parameters, elapsed, rows)
+
+# Соединение, все запросы которого (в том числе conn.execute) идут через InstrumentedCursor
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# Функция для подключения к базе данных SQLite с настройкой PRAGMA
+def connect_db(database_file=None):
+    conn = sqlite3.connect(database_file or DATABASE_FILE, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                           isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE,
+                           factory=InstrumentedConnection if QUERY_INSTRUMENTATION else sqlite3.Connection)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+# Захват блокировки записи с повтором и экспоненциальной задержкой, если база занята другим процессом
+def begin_immediate(conn):
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as error:
+            message = str(error)
+            if attempt == WRITE_RETRIES or ("locked" not in message and "busy" not in message):
+                raise
+            time.sleep(WRITE_RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random()))
+
+
+# Единственный писатель: все записи выполняются по очереди в отдельном потоке на своём соединении,
+# а чтения параллельно идут через пул (в режиме WAL читатели не ждут писателя)
+class SingleWriter:
+    def __init__(self, database_file=None):
+        self.database_file = database_file
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="fleet-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        future = Future()
+        self._jobs.put((future, func, args))
+        return future.result()
+
+    def _run(self):
+        conn = connect_db(self.database_file)
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            future, func, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                begin_immediate(conn)
+                try:
+                    result = func(conn, *args)
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        conn.close()
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+
+# Хранилище с небольшим пулом постоянных соединений
+class FleetRepository:
+    def __init__(self, database_file=None, pool_size=POOL_SIZE, single_writer=False):
+        self.database_file = database_file
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._writer = SingleWriter(database_file) if single_writer else None
+
+    # Берём свободное соединение или открываем новое, пока не достигнут размер пула
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.pool_size
+            if can_create:
+                self._created += 1
+        if not can_create:
+            return self._pool.get()
+        try:
+            return connect_db(self.database_file)
+        except sqlite3.Error:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put(conn)
+
+    # Соединение из пула для чтения
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    # Транзакция: commit при успехе, rollback при ошибке
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            begin_immediate(conn)
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    # Запись func(conn, *args) в транзакции; в режиме сервера — через очередь единственного писателя
+    def write(self, func, *args):
+        if self._writer is not None:
+            return self._writer.submit(func, *args)
+        with self.transaction() as conn:
+            return func(conn, *args)
+
+    # Закрытие всех соединений пула
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        with self._lock:
+            while True:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._created -= 1
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+# Общий экземпляр хранилища для всего приложения
+def get_repository():
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = FleetRepository()
+        return _repository
+
+# Переключение приложения на другой файл базы или режим работы (бенчмарки, режим сервера)
+def use_database(database_file, pool_size=POOL_SIZE, single_writer=False):
+    global DATABASE_FILE, _repository
+    with _repository_lock:
+        if _repository is not None:
+            _repository.close()
+        DATABASE_FILE = database_file
+        _repository = FleetRepository(database_file, pool_size, single_writer)
+    record_cache.clear()
+
+# Инициализация базы данных
+def init_db():
+    repository = get_repository()
+    with repository.transaction() as conn:
+        conn.execute(CREATE_VEHICLES_SQL)
+        conn.execute(CREATE_TRAILERS_SQL)
+    run_migrations(repository)
+
+# Применение миграций, версия схемы хранится в PRAGMA user_version
+def run_migrations(repository):
+    with repository.connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target_version, migration in MIGRATIONS:
+        if version < target_version:
+            migration(repository)
+            with repository.transaction() as conn:
+                conn.execute(f"PRAGMA user_version = {target_version}")
+            version = target_version
+    with repository.connection() as conn:
+        conn.execute("PRAGMA optimize")
+
+# Миграция 1: перевод дат из DD/MM/YYYY в ISO (YYYY-MM-DD) пакетами и индексы по датам.
+# Даты разбираются через strptime, как при сохранении в старых версиях, поэтому "1/2/2027" тоже переводится.
+# Нераспознанные значения переносятся в invalid_dates, а в колонке остаётся пустая строка
+def migrate_dates_to_iso(repository):
+    log = logging.getLogger("fleet.migrations")
+    for table, columns in DATE_COLUMNS.items():
+        select_sql = f"SELECT id, {', '.join(columns)} FROM {table} WHERE id BETWEEN ? AND ?"
+        update_sql = f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?"
+        with repository.connection() as conn:
+            max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        # Каждая порция — отдельная транзакция; повторный запуск безопасен, ISO-даты остаются без изменений
+        for first_id in range(0, max_id + 1, MIGRATION_BATCH_SIZE):
+            with repository.transaction() as conn:
+                conn.execute(CREATE_INVALID_DATES_SQL)
+                updates, rejected = [], []
+                for row_id, *values in conn.execute(select_sql, (first_id, first_id + MIGRATION_BATCH_SIZE - 1)):
+                    converted = []
+                    for column, value in zip(columns, values):
+                        try:
+                            converted.append(_parse_import_date(value.strip()) if value else value)
+                        except ValueError:
+                            rejected.append((table, row_id, column, value))
+                            converted.append("")
+                    if converted != values:
+                        updates.append((*converted, row_id))
+                conn.executemany(update_sql, updates)
+                conn.executemany("INSERT OR REPLACE INTO invalid_dates (table_name, row_id, column_name, value) "
+                                 "VALUES (?, ?, ?, ?)", rejected)
+                for rejected_table, row_id, column, value in rejected:
+                    log.warning("%s.%s (id=%d): nieprawidłowa data %r przeniesiona do invalid_dates",
+                                rejected_table, column, row_id, value)
+        with repository.transaction() as conn:
+            for column in columns:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+
+# SQL для вставки событий одного актива из NEW-строки триггера
+def _compliance_inserts_sql(asset_type):
+    table, number_column, kinds = ASSET_TABLES[asset_type]
+    return "\n".join(
+        f"INSERT INTO compliance_events (asset_type, asset_number, event_kind, due_date) "
+        f"SELECT '{asset_type}', NEW.{number_column}, '{kind}', NEW.{column} WHERE NEW.{column} <> '';"
+        for kind, column in kinds.items()
+    )
+
+# Миграция 2: таблица compliance_events, триггеры для её поддержки и заполнение из текущих данных
+def create_compliance_events(repository):
+    with repository.transaction() as conn:
+        conn.execute(CREATE_COMPLIANCE_EVENTS_SQL)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_compliance_events_due "
+                     "ON compliance_events (due_date, event_kind, asset_type, asset_number)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_compliance_events_kind_due "
+                     "ON compliance_events (event_kind, due_date)")
+        for asset_type, (table, number_column, kinds) in ASSET_TABLES.items():
+            changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}"
+                                  for column in (number_column, *kinds.values()))
+            inserts = _compliance_inserts_sql(asset_type)
+            delete_old = (f"DELETE FROM compliance_events "
+                          f"WHERE asset_type = '{asset_type}' AND asset_number = OLD.{number_column};")
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_events_insert AFTER INSERT ON {table}
+                BEGIN
+                    {inserts}
+                END""")
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_events_update AFTER UPDATE ON {table}
+                WHEN {changed}
+                BEGIN
+                    {delete_old}
+                    {inserts}
+                END""")
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_events_delete AFTER DELETE ON {table}
+                BEGIN
+                    {delete_old}
+                END""")
+            conn.execute("DELETE FROM compliance_events WHERE asset_type = ?", (asset_type,))
+            for kind, column in kinds.items():
+                conn.execute(f"""
+                    INSERT INTO compliance_events (asset_type, asset_number, event_kind, due_date)
+                    SELECT ?, {number_column}, ?, {column} FROM {table} WHERE {column} <> ''""",
+                             (asset_type, kind))
+
+# Миграция 3: индекс (due_date, rowid) для постраничной выборки по ключу (due_date, id)
+def create_events_keyset_index(repository):
+    with repository.transaction() as conn:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_compliance_events_keyset ON compliance_events (due_date)")
+
+# Номера, совпадающие после нормализации ("WGM 1234" и "WGM1234"): остаётся самая новая строка (наибольший id),
+# остальные целиком переносятся в duplicate_plates и удаляются, чтобы можно было создать уникальный индекс
+def _quarantine_duplicate_plates(conn, table, number_column):
+    conn.execute(CREATE_DUPLICATE_PLATES_SQL)
+    duplicates = conn.execute(f"""
+        SELECT duplicate.*, kept.id FROM {table} AS duplicate
+        JOIN (SELECT plate_key, MAX(id) AS id FROM {table} GROUP BY plate_key HAVING COUNT(*) > 1) AS kept
+          ON kept.plate_key = duplicate.plate_key AND duplicate.id <> kept.id""")
+    columns = [column[0] for column in duplicates.description[:-1]]
+    log = logging.getLogger("fleet.migrations")
+    for *values, kept_id in duplicates.fetchall():
+        row = dict(zip(columns, values))
+        conn.execute("INSERT OR REPLACE INTO duplicate_plates (table_name, row_id, kept_id, asset_number, row_data) "
+                     "VALUES (?, ?, ?, ?, ?)", (table, row["id"], kept_id, row[number_column], json.dumps(row)))
+        conn.execute(f"DELETE FROM {table} WHERE id = ?", (row["id"],))
+        log.warning("%s: numer %r (id=%d) powiela zapis id=%d, przeniesiony do duplicate_plates",
+                    table, row[number_column], row["id"], kept_id)
+
+# Миграция 4: канонический ключ номера с уникальным индексом и триграммный индекс FTS5 для поиска по части номера
+def create_plate_keys(repository):
+    with repository.transaction() as conn:
+        for asset_type, (table, number_column, _) in ASSET_TABLES.items():
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN plate_key TEXT "
+                         f"GENERATED ALWAYS AS ({PLATE_KEY_SQL.format(number_column)}) VIRTUAL")
+            _quarantine_duplicate_plates(conn, table, number_column)
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_plate_key ON {table} (plate_key)")
+    try:
+        with repository.transaction() as conn:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS plate_search "
+                         "USING fts5(plate_key, asset_type UNINDEXED, asset_number UNINDEXED, tokenize='trigram')")
+            # rowid в plate_search: id * 2 для машин и id * 2 + 1 для прицепов
+            for offset, (asset_type, (table, number_column, _)) in enumerate(ASSET_TABLES.items()):
+                insert = (f"INSERT INTO plate_search (rowid, plate_key, asset_type, asset_number) "
+                          f"VALUES (NEW.id * 2 + {offset}, NEW.plate_key, '{asset_type}', NEW.{number_column});")
+                delete = f"DELETE FROM plate_search WHERE rowid = OLD.id * 2 + {offset};"
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_plate_search_insert "
+                             f"AFTER INSERT ON {table} BEGIN {insert} END")
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_plate_search_update "
+                             f"AFTER UPDATE OF {number_column} ON {table} BEGIN {delete} {insert} END")
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_plate_search_delete "
+                             f"AFTER DELETE ON {table} BEGIN {delete} END")
+                conn.execute(f"""
+                    INSERT INTO plate_search (rowid, plate_key, asset_type, asset_number)
+                    SELECT id * 2 + {offset}, plate_key, ?, {number_column} FROM {table}""", (asset_type,))
+    except sqlite3.OperationalError:
+        # SQLite без FTS5 или без токенизатора trigram: поиск работает только по префиксу ключа
+        pass
+
+
+# Миграция 5: история полисов и сроков с интервалами действия [valid_from, valid_to), ведётся триггерами
+HISTORY_COLUMNS = ("insurance_number", "insurance_expiry", "inspection_expiry", "tachograph_calibration")
+HISTORY_TIMESTAMP_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+# Строки, существовавшие до появления истории, считаются действующими с самого начала
+HISTORY_EPOCH = "0001-01-01 00:00:00"
+
+CREATE_ASSET_HISTORY_SQL = """
+    CREATE TABLE IF NOT EXISTS asset_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        asset_type TEXT NOT NULL,
+        plate_key TEXT NOT NULL,
+        asset_number TEXT NOT NULL,
+        insurance_number TEXT,
+        insurance_expiry TEXT,
+        inspection_expiry TEXT,
+        tachograph_calibration TEXT,
+        valid_from TEXT NOT NULL,
+        valid_to TEXT
+    )"""
+
+def create_asset_history(repository):
+    with repository.transaction() as conn:
+        conn.execute(CREATE_ASSET_HISTORY_SQL)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_asset_history_asset "
+                     "ON asset_history (asset_type, plate_key, valid_from)")
+        for asset_type, columns in ASSET_COLUMNS.items():
+            table, number_column, _ = ASSET_TABLES[asset_type]
+            tracked = columns[1:]
+            history_columns = ", ".join(HISTORY_COLUMNS[:len(tracked)])
+            changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+            close_old = (f"UPDATE asset_history SET valid_to = {HISTORY_TIMESTAMP_SQL} "
+                         f"WHERE asset_type = '{asset_type}' AND plate_key = OLD.plate_key AND valid_to IS NULL;")
+            insert_new = (f"INSERT INTO asset_history (asset_type, plate_key, asset_number, {history_columns}, valid_from) "
+                          f"VALUES ('{asset_type}', NEW.plate_key, NEW.{number_column}, "
+                          f"{', '.join(f'NEW.{column}' for column in tracked)}, {HISTORY_TIMESTAMP_SQL});")
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_history_insert "
+                         f"AFTER INSERT ON {table} BEGIN {insert_new} END")
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_history_update "
+                         f"AFTER UPDATE ON {table} WHEN {changed} BEGIN {close_old} {insert_new} END")
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_history_delete "
+                         f"AFTER DELETE ON {table} BEGIN {close_old} END")
+            conn.execute("DELETE FROM asset_history WHERE asset_type = ?", (asset_type,))
+            conn.execute(f"""
+                INSERT INTO asset_history (asset_type, plate_key, asset_number, {history_columns}, valid_from)
+                SELECT ?, plate_key, {', '.join(columns)}, ? FROM {table}""", (asset_type, HISTORY_EPOCH))
+
+# Миграция 6: метаданные документов (содержимое лежит в хранилище по SHA-256) и их привязка к машинам и прицепам
+def create_documents(repository):
+    with repository.transaction() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mime_type TEXT,
+                created_at TEXT NOT NULL
+            ) WITHOUT ROWID""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS asset_documents (
+                id INTEGER PRIMARY KEY,
+                asset_type TEXT NOT NULL,
+                asset_id INTEGER NOT NULL,
+                document_kind TEXT NOT NULL,
+                sha256 TEXT NOT NULL REFERENCES documents (sha256),
+                file_name TEXT NOT NULL,
+                added_at TEXT NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_asset_documents_asset "
+                     "ON asset_documents (asset_type, asset_id, document_kind)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_asset_documents_sha ON asset_documents (sha256)")
+        for asset_type, (table, _, _) in ASSET_TABLES.items():
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_documents_delete AFTER DELETE ON {table} "
+                         f"BEGIN DELETE FROM asset_documents WHERE asset_type = '{asset_type}' AND asset_id = OLD.id; END")
 
-    conn.commit()
-    conn.close()
+# Миграция 7: сцепки тягач–прицеп и назначения водителей с интервалами [start_at, end_at); end_at NULL — по сей день
+INTERVAL_TABLES = {
+    "couplings": ("vehicle_id", "trailer_id"),
+    "driver_assignments": ("vehicle_id", "driver_id"),
+}
+
+def create_couplings(repository):
+    with repository.transaction() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS drivers (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE COLLATE NOCASE
+            )""")
+        for table, (first_column, second_column) in INTERVAL_TABLES.items():
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    {first_column} INTEGER NOT NULL,
+                    {second_column} INTEGER NOT NULL,
+                    start_at TEXT NOT NULL,
+                    end_at TEXT,
+                    CHECK (end_at IS NULL OR end_at > start_at)
+                )""")
+            # У каждого участника интервалы не пересекаются, поэтому поиск по (участник, start_at)
+            # находит пересечения за один спуск по индексу независимо от длины истории
+            for column in (first_column, second_column):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column}, start_at)")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS trg_vehicles_intervals_delete AFTER DELETE ON vehicles BEGIN "
+                     "DELETE FROM couplings WHERE vehicle_id = OLD.id; "
+                     "DELETE FROM driver_assignments WHERE vehicle_id = OLD.id; END")
+        conn.execute("CREATE TRIGGER IF NOT EXISTS trg_trailers_intervals_delete AFTER DELETE ON trailers BEGIN "
+                     "DELETE FROM couplings WHERE trailer_id = OLD.id; END")
+
+# Миграция 9: дата последнего прохода планировщика напоминаний, чтобы после перезапуска
+# догонять только напоминания, пропущенные с тех пор
+def create_alert_state(repository):
+    with repository.transaction() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS alert_state (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                     "last_run TEXT NOT NULL)")
+
+MIGRATIONS = [
+    (1, migrate_dates_to_iso),
+    (2, create_compliance_events),
+    (3, create_events_keyset_index),
+    (4, create_plate_keys),
+    (5, create_asset_history),
+    (6, create_documents),
+    (7, create_couplings),
+    # Повтор миграции 1 для баз, в которых старая версия пропустила даты без ведущих нулей;
+    # триггеры обновления заодно перезаписывают compliance_events
+    (8, migrate_dates_to_iso),
+    (9, create_alert_state),
+]
 
 # Функция для проверки формата даты
 def is_valid_date(date_string):
@@ -46,100 +761,739 @@ def is_valid_date(date_string):
     except ValueError:
         return False
 
+# Канонический ключ номера, совпадает с колонкой plate_key
+def normalize_plate(number):
+    return "".join(char.upper() if char.isascii() else char
+                   for char in (number or "").strip() if char not in PLATE_SEPARATORS)
+
+# Перевод даты из формата интерфейса (DD/MM/YYYY) в формат хранения (YYYY-MM-DD)
+def to_iso_date(date_string):
+    if not date_string:
+        return date_string
+    return datetime.strptime(date_string, "%d/%m/%Y").strftime("%Y-%m-%d")
+
+# Перевод даты из формата хранения обратно в формат интерфейса
+def format_date(iso_date):
+    try:
+        return datetime.strptime(iso_date, "%Y-%m-%d").strftime("%d/%m/%Y")
+    except (TypeError, ValueError):
+        return iso_date
+
+# UPSERT для актива: пустые значения не затирают уже сохранённые данные
+def _upsert_sql(asset_type):
+    table = ASSET_TABLES[asset_type][0]
+    columns = ASSET_COLUMNS[asset_type]
+    updates = ", ".join(f"{column} = COALESCE(NULLIF(excluded.{column}, ''), {column})" for column in columns[1:])
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(plate_key) DO UPDATE SET {updates}")
+
+UPSERT_SQL = {asset_type: _upsert_sql(asset_type) for asset_type in ASSET_COLUMNS}
+
+# Подготовка строки для UPSERT: даты в ISO, отсутствующие значения — пустые строки
+def _prepare_asset_row(asset_type, values):
+    date_columns = DATE_COLUMNS[ASSET_TABLES[asset_type][0]]
+    return [to_iso_date(value or "") if column in date_columns else (value or "")
+            for column, value in zip(ASSET_COLUMNS[asset_type], values)]
+
+_asset_listeners = []
+
+# Подписка на сохранение активов: listener(asset_type, plate_keys) вызывается после commit
+def add_asset_listener(listener):
+    _asset_listeners.append(listener)
+
+def remove_asset_listener(listener):
+    _asset_listeners.remove(listener)
+
+def _notify_assets_saved(asset_type, plate_keys):
+    for listener in list(_asset_listeners):
+        listener(asset_type, plate_keys)
+
+# Пакетное сохранение активов одним executemany и одним commit
+def _save_many(asset_type, records):
+    rows = [_prepare_asset_row(asset_type, values) for values in records]
+    saved = get_repository().write(lambda conn: conn.executemany(UPSERT_SQL[asset_type], rows).rowcount)
+    _notify_assets_saved(asset_type, [normalize_plate(row[0]) for row in rows])
+    return saved
+
+# Пакетное сохранение машин: кортежи (номер, страховка, окончание страховки, техосмотр, калибровка тахографа)
+def save_many_vehicles(records):
+    return _save_many("vehicle", records)
+
+# Пакетное сохранение прицепов: кортежи (номер, страховка, окончание страховки, техосмотр)
+def save_many_trailers(records):
+    return _save_many("trailer", records)
+
 # Функция для сохранения или обновления данных о машине
 def save_or_update_vehicle(vehicle_number, insurance_number=None, insurance_expiry=None, inspection_expiry=None,
                            tachograph_calibration=None):
-    conn, cursor = connect_db()
-    cursor.execute("SELECT * FROM vehicles WHERE vehicle_number = ?", (vehicle_number,))
-    result = cursor.fetchone()
-
-    if result:
-        # Сохраняем текущие данные, если новые данные не были введены
-        current_insurance_number = result[1] if not insurance_number else insurance_number
-        current_insurance_expiry = result[2] if not insurance_expiry else insurance_expiry
-        current_inspection_expiry = result[3] if not inspection_expiry else inspection_expiry
-        current_tachograph_calibration = result[4] if not tachograph_calibration else tachograph_calibration
-
-        cursor.execute('''
-        UPDATE vehicles
-        SET insurance_number = ?, insurance_expiry = ?, inspection_expiry = ?, tachograph_calibration = ?
-        WHERE vehicle_number = ?''',
-                       (current_insurance_number, current_insurance_expiry, current_inspection_expiry, current_tachograph_calibration, vehicle_number))
-    else:
-        # Вставляем новые данные, если запись не существует
-        cursor.execute('''
-        INSERT INTO vehicles (vehicle_number, insurance_number, insurance_expiry, inspection_expiry, tachograph_calibration)
-        VALUES (?, ?, ?, ?, ?)''',
-                       (vehicle_number, insurance_number, insurance_expiry, inspection_expiry, tachograph_calibration))
-
-    conn.commit()
-    conn.close()
+    save_many_vehicles([(vehicle_number, insurance_number, insurance_expiry, inspection_expiry,
+                         tachograph_calibration)])
 
 # Функция для сохранения или обновления данных о прицепе
 def save_or_update_trailer(trailer_number, trailer_insurance_number=None, trailer_insurance_expiry=None,
                            trailer_inspection_expiry=None):
-    conn, cursor = connect_db()
-    cursor.execute("SELECT * FROM trailers WHERE trailer_number = ?", (trailer_number,))
-    result = cursor.fetchone()
-
-    if result:
-        # Сохраняем текущие данные, если новые данные не были введены
-        current_trailer_insurance_number = result[1] if not trailer_insurance_number else trailer_insurance_number
-        current_trailer_insurance_expiry = result[2] if not trailer_insurance_expiry else trailer_insurance_expiry
-        current_trailer_inspection_expiry = result[3] if not trailer_inspection_expiry else trailer_inspection_expiry
-
-        cursor.execute('''
-        UPDATE trailers
-        SET trailer_insurance_number = ?, trailer_insurance_expiry = ?, trailer_inspection_expiry = ?
-        WHERE trailer_number = ?''',
-                       (current_trailer_insurance_number, current_trailer_insurance_expiry, current_trailer_inspection_expiry, trailer_number))
-    else:
-        # Вставляем новые данные, если запись не существует
-        cursor.execute('''
-        INSERT INTO trailers (trailer_number, trailer_insurance_number, trailer_insurance_expiry, trailer_inspection_expiry)
-        VALUES (?, ?, ?, ?)''',
-                       (trailer_number, trailer_insurance_number, trailer_insurance_expiry, trailer_inspection_expiry))
-
-    conn.commit()
-    conn.close()
-
-# Функция для поиска по дате
-def search_by_date(start_date, end_date):
-    conn, cursor = connect_db()
-
-    cursor.execute('''
-    SELECT * FROM vehicles 
-    WHERE insurance_expiry BETWEEN ? AND ? 
-       OR inspection_expiry BETWEEN ? AND ? 
-       OR tachograph_calibration BETWEEN ? AND ?''',
-                   (start_date, end_date, start_date, end_date, start_date, end_date))
-    vehicle_results = cursor.fetchall()
-
-    cursor.execute('''
-    SELECT * FROM trailers 
-    WHERE trailer_insurance_expiry BETWEEN ? AND ?
-       OR trailer_inspection_expiry BETWEEN ? AND ?''',
-                   (start_date, end_date, start_date, end_date))
-    trailer_results = cursor.fetchall()
-
-    conn.close()
-    return vehicle_results, trailer_results
+    save_many_trailers([(trailer_number, trailer_insurance_number, trailer_insurance_expiry,
+                         trailer_inspection_expiry)])
+
+# Условие WHERE по диапазону дат и видам событий для compliance_events
+def _events_filter(start_date, end_date, event_kinds=None):
+    condition = "due_date BETWEEN ? AND ?"
+    parameters = [to_iso_date(start_date), to_iso_date(end_date)]
+    if event_kinds:
+        condition += f" AND event_kind IN ({', '.join('?' * len(event_kinds))})"
+        parameters.extend(event_kinds)
+    return condition, parameters
+
+# Функция для поиска событий (окончаний сроков) в диапазоне дат — один диапазонный скан по индексу
+def search_compliance_events(start_date, end_date, event_kinds=None):
+    condition, parameters = _events_filter(start_date, end_date, event_kinds)
+    with get_repository().connection() as conn:
+        return conn.execute(f"""
+            SELECT asset_type, asset_number, event_kind, due_date FROM compliance_events
+            WHERE {condition} ORDER BY due_date, id""", parameters).fetchall()
+
+# Страница событий с keyset-пагинацией: after — (значение колонки сортировки, id) последней строки
+def fetch_events_page(start_date, end_date, event_kinds=None, sort_column="due_date", descending=False,
+                      after=None, limit=RESULTS_PAGE_SIZE):
+    if sort_column not in EVENT_SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {sort_column}")
+    condition, parameters = _events_filter(start_date, end_date, event_kinds)
+    comparison, direction = ("<", "DESC") if descending else (">", "ASC")
+    if after is not None:
+        if sort_column == "due_date":
+            # Граница диапазона со стороны сортировки заменяется ключом, чтобы поиск в индексе начинался с него
+            condition = condition.replace("due_date BETWEEN ? AND ?", "due_date >= ?" if descending else "due_date <= ?", 1)
+            del parameters[1 if descending else 0]
+        condition += f" AND ({sort_column}, id) {comparison} (?, ?)"
+        parameters.extend(after)
+    with get_repository().connection() as conn:
+        return conn.execute(f"""
+            SELECT {', '.join(EVENT_PAGE_COLUMNS)} FROM compliance_events
+            WHERE {condition}
+            ORDER BY {sort_column} {direction}, id {direction} LIMIT ?""", [*parameters, limit]).fetchall()
+
+# Версии полиса и сроков актива, от новых к старым
+HistoryEntry = namedtuple("HistoryEntry", ("asset_number", *HISTORY_COLUMNS, "valid_from", "valid_to"))
+HISTORY_SELECT_SQL = f"SELECT asset_number, {', '.join(HISTORY_COLUMNS)}, valid_from, valid_to FROM asset_history"
+
+def asset_history(number, asset_type="vehicle"):
+    with get_repository().connection() as conn:
+        rows = conn.execute(f"""
+            {HISTORY_SELECT_SQL} WHERE asset_type = ? AND plate_key = ?
+            ORDER BY valid_from DESC, id DESC""", (asset_type, normalize_plate(number))).fetchall()
+    return [HistoryEntry(*row) for row in rows]
+
+# Состояние актива на конец дня on_date (DD/MM/RRRR): один спуск по индексу (asset_type, plate_key, valid_from)
+def as_of(number, on_date, asset_type="vehicle"):
+    with get_repository().connection() as conn:
+        row = conn.execute(f"""
+            {HISTORY_SELECT_SQL} WHERE asset_type = ? AND plate_key = ? AND valid_from < date(?, '+1 day')
+            ORDER BY valid_from DESC, id DESC LIMIT 1""",
+                           (asset_type, normalize_plate(number), to_iso_date(on_date))).fetchone()
+    if row is None or (row[-1] is not None and row[-1] < to_iso_date(on_date)):
+        # Версии нет или актив был удалён до этого дня
+        return None
+    return HistoryEntry(*row)
+
+# Отбор по диапазону due_date, тип актива — только фильтр: "+asset_type" не даёт планировщику выбрать
+# индекс UNIQUE (asset_type, ...), который без ANALYZE выглядит выгоднее и читает все события этого типа
+SEARCH_BY_DATE_SQL = """
+    SELECT * FROM {table} WHERE {number_column} IN (
+        SELECT asset_number FROM compliance_events WHERE +asset_type = ? AND {condition})"""
+
+# Функция для поиска по дате: записи машин и прицепов, у которых есть события в диапазоне
+def search_by_date(start_date, end_date, event_kinds=None):
+    condition, parameters = _events_filter(start_date, end_date, event_kinds)
+    results = []
+    with get_repository().connection() as conn:
+        for asset_type, (table, number_column, _) in ASSET_TABLES.items():
+            results.append(conn.execute(SEARCH_BY_DATE_SQL.format(table=table, number_column=number_column,
+                                                                  condition=condition),
+                                        [asset_type, *parameters]).fetchall())
+    return tuple(results)
+
+# Кэш записей машин и прицепов (LRU), общий для всех сессий; ключ — (тип актива, plate_key)
+RECORD_CACHE_SIZE = 1024
+
+class RecordCache:
+    def __init__(self, max_size=RECORD_CACHE_SIZE):
+        self.max_size = max_size
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Чтение через кэш: при промахе запись загружается loader() и кладётся в кэш
+    def get_or_load(self, key, loader):
+        with self._lock:
+            if key in self._records:
+                self._records.move_to_end(key)
+                self.hits += 1
+                return self._records[key]
+            self.misses += 1
+            version = self._version
+        value = loader()
+        with self._lock:
+            # Если во время загрузки была запись, загруженное значение могло устареть — не кэшируем его
+            if version == self._version:
+                self._records[key] = value
+                self._records.move_to_end(key)
+                while len(self._records) > self.max_size:
+                    self._records.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._version += 1
+            for key in keys:
+                self._records.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._records.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._records), "max_size": self.max_size, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+record_cache = RecordCache()
+add_asset_listener(lambda asset_type, plate_keys: record_cache.invalidate(
+    [(asset_type, plate_key) for plate_key in plate_keys]))
+
+def _load_asset(asset_type, sql, number):
+    plate_key = normalize_plate(number)
+
+    def load():
+        with get_repository().connection() as conn:
+            return tuple(conn.execute(sql, (plate_key,)).fetchall())
+    return list(record_cache.get_or_load((asset_type, plate_key), load))
 
 # Функция для поиска машины по номеру
 def search_vehicle_by_number(vehicle_number):
-    conn, cursor = connect_db()
-    cursor.execute("SELECT * FROM vehicles WHERE vehicle_number = ?", (vehicle_number,))
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    return _load_asset("vehicle", SELECT_VEHICLE_SQL, vehicle_number)
 
 # Функция для поиска прицепа по номеру
 def search_trailer_by_number(trailer_number):
-    conn, cursor = connect_db()
-    cursor.execute("SELECT * FROM trailers WHERE trailer_number = ?", (trailer_number,))
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    return _load_asset("trailer", SELECT_TRAILER_SQL, trailer_number)
+
+# Поиск по части номера среди машин и прицепов: точное совпадение, затем префикс, затем вхождение
+def search_plates(text, limit=PLATE_SEARCH_LIMIT):
+    key = normalize_plate(text)
+    if not key:
+        return []
+    with get_repository().connection() as conn:
+        has_fts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'plate_search'").fetchone()
+        if has_fts and len(key) >= 3:
+            # Триграммный индекс находит вхождение в любом месте номера
+            return conn.execute('''
+                SELECT asset_type, asset_number FROM plate_search WHERE plate_search MATCH ?
+                ORDER BY plate_key = ? DESC, substr(plate_key, 1, ?) = ? DESC, length(plate_key), plate_key
+                LIMIT ?''', ('"' + key.replace('"', '""') + '"', key, len(key), key, limit)).fetchall()
+        # Короткий запрос (меньше трёх символов) — диапазон по индексу plate_key
+        return conn.execute('''
+            SELECT asset_type, asset_number FROM (
+                SELECT 'vehicle' AS asset_type, vehicle_number AS asset_number, plate_key FROM vehicles
+                WHERE plate_key >= ?1 AND plate_key < ?1 || char(1114111)
+                UNION ALL
+                SELECT 'trailer', trailer_number, plate_key FROM trailers
+                WHERE plate_key >= ?1 AND plate_key < ?1 || char(1114111))
+            ORDER BY length(plate_key), plate_key LIMIT ?2''', (key, limit)).fetchall()
+
+IMPORT_CHUNK_SIZE = 1000
+
+ImportReport = namedtuple("ImportReport", "asset_type total imported errors seconds rows_per_second")
+
+# Разбор даты из файла импорта: DD/MM/YYYY, YYYY-MM-DD или дата из ячейки XLSX
+@lru_cache(maxsize=4096)
+def _parse_import_date(value):
+    for date_format in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ValueError(f"nieprawidłowa data: {value}")
+
+def _import_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return str(value).strip()
+
+# Потоковое чтение строк из CSV или XLSX: сначала заголовок, затем строки значений
+def _read_table_file(path):
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook  # необязательная зависимость, нужна только для XLSX
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield [_import_cell(value) for value in row]
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            dialect = csv.Sniffer().sniff(file.read(4096), delimiters=",;\t")
+            file.seek(0)
+            for row in csv.reader(file, dialect):
+                yield [value.strip() for value in row]
+
+# Проверка порции строк: номер обязателен, все даты приводятся к ISO за один проход по порции
+def _validate_chunk(chunk, asset_type):
+    date_positions = [position for position, column in enumerate(ASSET_COLUMNS[asset_type])
+                      if column in DATE_COLUMNS[ASSET_TABLES[asset_type][0]]]
+    valid_rows, errors = [], []
+    for row_number, values in chunk:
+        try:
+            if not values[0]:
+                raise ValueError("brak numeru")
+            for position in date_positions:
+                if values[position]:
+                    values[position] = _parse_import_date(values[position])
+        except ValueError as error:
+            errors.append((row_number, str(error)))
+        else:
+            valid_rows.append(values)
+    return valid_rows, errors
+
+# Массовый импорт машин или прицепов из CSV/XLSX одной транзакцией
+def import_fleet(path, chunk_size=IMPORT_CHUNK_SIZE):
+    started = time.perf_counter()
+    rows = _read_table_file(path)
+    header = [column.lower() for column in next(rows, [])]
+    asset_type = next((asset_type for asset_type, columns in ASSET_COLUMNS.items() if columns[0] in header), None)
+    if asset_type is None:
+        raise ValueError("Plik musi zawierać kolumnę vehicle_number lub trailer_number")
+    positions = [header.index(column) if column in header else None for column in ASSET_COLUMNS[asset_type]]
+
+    records = ((row_number, [row[position] if position is not None and position < len(row) else ""
+                             for position in positions])
+               for row_number, row in enumerate(rows, start=2) if any(row))
+
+    def load(conn):
+        total, errors, plate_keys = 0, [], []
+        for chunk in iter(lambda: list(islice(records, chunk_size)), []):
+            valid_rows, chunk_errors = _validate_chunk(chunk, asset_type)
+            conn.executemany(UPSERT_SQL[asset_type], valid_rows)
+            total += len(chunk)
+            errors.extend(chunk_errors)
+            plate_keys.extend(normalize_plate(values[0]) for values in valid_rows)
+        return total, errors, plate_keys
+
+    total, errors, plate_keys = get_repository().write(load)
+    _notify_assets_saved(asset_type, plate_keys)
+    imported = len(plate_keys)
+
+    seconds = time.perf_counter() - started
+    return ImportReport(asset_type, total, imported, errors, seconds, imported / seconds if seconds else 0.0)
+
+# Текст отчёта об импорте
+def format_import_report(report, max_errors=20):
+    lines = [f"Zaimportowano {report.imported} z {report.total} wierszy "
+             f"({report.rows_per_second:.0f} wierszy/s, {report.seconds:.2f} s)"]
+    if report.errors:
+        lines.append(f"Błędy: {len(report.errors)}")
+        lines.extend(f"Wiersz {row_number}: {message}" for row_number, message in report.errors[:max_errors])
+    return "\n".join(lines)
+
+# Потоковый экспорт в CSV/XLSX: строки читаются из курсора порциями и сразу пишутся в файл
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_KINDS = {
+    "vehicles": (("vehicle_number", "insurance_number", "insurance_expiry", "inspection_expiry",
+                  "tachograph_calibration"), "FROM vehicles", "ORDER BY plate_key"),
+    "trailers": (("trailer_number", "trailer_insurance_number", "trailer_insurance_expiry",
+                  "trailer_inspection_expiry"), "FROM trailers", "ORDER BY plate_key"),
+    "events": (("asset_type", "asset_number", "event_kind", "due_date"), "FROM compliance_events",
+               "ORDER BY due_date, id"),
+}
+EXPORT_LABELS = {"vehicles": "Pojazdy", "trailers": "Przyczepy", "events": "Terminy w zakresie dat"}
+
+# Генератор порций строк экспорта; для "events" нужен диапазон дат
+def iter_export_chunks(kind, start_date=None, end_date=None, chunk_size=EXPORT_CHUNK_SIZE):
+    columns, source, order = EXPORT_KINDS[kind]
+    condition, parameters = ("", [])
+    if kind == "events":
+        condition, parameters = _events_filter(start_date, end_date)
+        condition = "WHERE " + condition
+    with get_repository().connection() as conn:
+        cursor = conn.execute(f"SELECT {', '.join(columns)} {source} {condition} {order}", parameters)
+        for chunk in iter(lambda: cursor.fetchmany(chunk_size), []):
+            yield chunk
+
+def count_export_rows(kind, start_date=None, end_date=None):
+    _, source, _ = EXPORT_KINDS[kind]
+    condition, parameters = ("", [])
+    if kind == "events":
+        condition, parameters = _events_filter(start_date, end_date)
+        condition = "WHERE " + condition
+    with get_repository().connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) {source} {condition}", parameters).fetchone()[0]
+
+# Экспорт в файл .csv или .xlsx (openpyxl в режиме write_only); progress(записано, всего) после каждой порции
+def export_data(kind, path, start_date=None, end_date=None, progress=None):
+    total = count_export_rows(kind, start_date, end_date) if progress else 0
+    columns = EXPORT_KINDS[kind][0]
+    written = 0
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import Workbook  # необязательная зависимость, нужна только для XLSX
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(kind)
+        sheet.append(columns)
+        for chunk in iter_export_chunks(kind, start_date, end_date):
+            for row in chunk:
+                sheet.append(row)
+            written += len(chunk)
+            if progress:
+                progress(written, total)
+        workbook.save(path)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for chunk in iter_export_chunks(kind, start_date, end_date):
+                writer.writerows(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(written, total)
+    return written
+
+# Хранилище документов (сканы полисов, протоколов техосмотра, калибровки тахографа): файлы адресуются
+# по SHA-256 содержимого, одинаковые файлы хранятся один раз
+DOCUMENT_STORE_DIR = "documents"
+DOCUMENT_CHUNK_SIZE = 1024 * 1024
+DOCUMENT_KINDS = {"insurance": "Polisa", "inspection": "Przegląd", "tachograph": "Kalibracja tachografu",
+                  "other": "Inny"}
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_CACHE_BYTES = 32 * 1024 * 1024
+
+DocumentInfo = namedtuple("DocumentInfo", "id document_kind file_name sha256 size mime_type added_at")
+
+class DocumentStore:
+    def __init__(self, root=None):
+        self.root = root or DOCUMENT_STORE_DIR
+
+    # Путь к содержимому: первые два символа хэша — подкаталог
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:])
+
+    # Потоковое копирование файла во временный файл хранилища с подсчётом хэша по порциям
+    def stage(self, source_path):
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        handle, temporary_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with open(source_path, "rb") as source, os.fdopen(handle, "wb") as target:
+                for chunk in iter(lambda: source.read(DOCUMENT_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    target.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        return temporary_path, digest.hexdigest(), size
+
+    # Перенос временного файла на место; если такое содержимое уже есть, копия просто удаляется
+    def commit(self, temporary_path, sha256):
+        path = self.path(sha256)
+        if os.path.exists(path):
+            os.remove(temporary_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary_path, path)
+
+    def put(self, source_path):
+        temporary_path, sha256, size = self.stage(source_path)
+        self.commit(temporary_path, sha256)
+        return sha256, size
+
+    def open(self, sha256):
+        return open(self.path(sha256), "rb")
+
+    # Потоковое копирование содержимого в указанный файл
+    def export(self, sha256, target_path):
+        with self.open(sha256) as source, open(target_path, "wb") as target:
+            shutil.copyfileobj(source, target, DOCUMENT_CHUNK_SIZE)
+
+    def remove(self, sha256):
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+_document_store = None
+
+def get_document_store():
+    global _document_store
+    if _document_store is None:
+        _document_store = DocumentStore()
+    return _document_store
+
+def _asset_id(conn, asset_type, number):
+    table = ASSET_TABLES[asset_type][0]
+    row = conn.execute(f"SELECT id FROM {table} WHERE plate_key = ?", (normalize_plate(number),)).fetchone()
+    if row is None:
+        raise LookupError(f"{ASSET_TYPE_LABELS[asset_type]} {number} nie istnieje")
+    return row[0]
+
+# Номер актива по внутреннему id (обратное к _asset_id)
+def _asset_number(conn, asset_type, asset_id):
+    table, number_column, _ = ASSET_TABLES[asset_type]
+    return conn.execute(f"SELECT {number_column} FROM {table} WHERE id = ?", (asset_id,)).fetchone()[0]
+
+# Прикрепление документа к машине или прицепу. Файл копируется до транзакции, а переносится на место
+# внутри неё, чтобы не разминуться с удалением того же содержимого в detach_document
+def attach_document(asset_type, number, document_kind, source_path, file_name=None):
+    store = get_document_store()
+    temporary_path, sha256, size = store.stage(source_path)
+    file_name = file_name or os.path.basename(source_path)
+    mime_type = mimetypes.guess_type(file_name)[0]
+
+    def insert(conn):
+        asset_id = _asset_id(conn, asset_type, number)
+        store.commit(temporary_path, sha256)
+        conn.execute("INSERT OR IGNORE INTO documents (sha256, size, mime_type, created_at) "
+                     "VALUES (?, ?, ?, datetime('now', 'localtime'))", (sha256, size, mime_type))
+        return conn.execute("""
+            INSERT INTO asset_documents (asset_type, asset_id, document_kind, sha256, file_name, added_at)
+            VALUES (?, ?, ?, ?, ?, datetime('now', 'localtime'))""",
+                            (asset_type, asset_id, document_kind, sha256, file_name)).lastrowid
+
+    try:
+        return get_repository().write(insert)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+# Список документов актива — только метаданные из базы, без чтения файлов
+def list_documents(asset_type, number):
+    table = ASSET_TABLES[asset_type][0]
+    with get_repository().connection() as conn:
+        rows = conn.execute(f"""
+            SELECT asset_documents.id, document_kind, file_name, documents.sha256, size, mime_type, added_at
+            FROM {table} JOIN asset_documents ON asset_documents.asset_type = ? AND asset_id = {table}.id
+            JOIN documents USING (sha256)
+            WHERE {table}.plate_key = ? ORDER BY document_kind, added_at DESC""",
+                            (asset_type, normalize_plate(number))).fetchall()
+    return [DocumentInfo(*row) for row in rows]
+
+# Открепление документа; содержимое удаляется в той же транзакции, когда на него больше нет ссылок
+def detach_document(document_id):
+    def delete(conn):
+        row = conn.execute("SELECT sha256 FROM asset_documents WHERE id = ?", (document_id,)).fetchone()
+        if row is None:
+            return
+        conn.execute("DELETE FROM asset_documents WHERE id = ?", (document_id,))
+        if conn.execute("SELECT 1 FROM asset_documents WHERE sha256 = ? LIMIT 1", row).fetchone() is None:
+            conn.execute("DELETE FROM documents WHERE sha256 = ?", row)
+            get_document_store().remove(row[0])
+            thumbnail_cache.invalidate(row)
+
+    get_repository().write(delete)
+
+# Миниатюры создаются по запросу и хранятся в LRU-кэше с ограничением по суммарному размеру в байтах
+class ThumbnailCache:
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._thumbnails = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, sha256, factory):
+        with self._lock:
+            if sha256 in self._thumbnails:
+                self._thumbnails.move_to_end(sha256)
+                return self._thumbnails[sha256]
+        thumbnail = factory()
+        if thumbnail is None or len(thumbnail) > self.max_bytes:
+            return thumbnail
+        with self._lock:
+            if sha256 not in self._thumbnails:
+                self._thumbnails[sha256] = thumbnail
+                self.size += len(thumbnail)
+                while self.size > self.max_bytes:
+                    _, evicted = self._thumbnails.popitem(last=False)
+                    self.size -= len(evicted)
+        return thumbnail
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                evicted = self._thumbnails.pop(key, None)
+                if evicted is not None:
+                    self.size -= len(evicted)
+
+thumbnail_cache = ThumbnailCache()
+
+def _render_thumbnail(sha256):
+    try:
+        from PIL import Image  # необязательная зависимость, без неё миниатюры не показываются
+    except ImportError:
+        return None
+    try:
+        # Pillow читает файл с диска сам и для JPEG уменьшает изображение уже при декодировании (draft)
+        with Image.open(get_document_store().path(sha256)) as image:
+            image.draft("RGB", THUMBNAIL_SIZE)
+            image.thumbnail(THUMBNAIL_SIZE)
+            output = io.BytesIO()
+            image.convert("RGB").save(output, "PNG")
+            return output.getvalue()
+    except (OSError, SyntaxError):
+        # Не изображение (например, PDF) или повреждённый файл
+        return None
+
+# Миниатюра документа в PNG или None, если для этого типа файла она не строится
+def document_thumbnail(sha256):
+    return thumbnail_cache.get_or_create(sha256, lambda: _render_thumbnail(sha256))
+
+# Сцепки тягач–прицеп и водители. Время хранится как "YYYY-MM-DD HH:MM", в интерфейсе — DD/MM/RRRR [GG:MM]
+OPEN_END = "9999-12-31 23:59"
+
+Interval = namedtuple("Interval", "id partner start_at end_at")
+Occupancy = namedtuple("Occupancy", "couplings drivers")
+
+class IntervalConflict(Exception):
+    def __init__(self, message, conflicts):
+        super().__init__(message)
+        self.conflicts = conflicts
+
+def to_iso_timestamp(text):
+    text = (text or "").strip()
+    for pattern in ("%d/%m/%Y %H:%M", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, pattern).strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            pass
+    raise ValueError(f"Nieprawidłowy format daty: {text}")
+
+def format_timestamp(timestamp):
+    if not timestamp:
+        return "obecnie"
+    return datetime.strptime(timestamp, "%Y-%m-%d %H:%M").strftime("%d/%m/%Y %H:%M")
+
+# Строки для окна с информацией об активе: сцепки и водители
+def format_occupancy(asset_type, occupancy):
+    partner_label = ASSET_TYPE_LABELS["trailer" if asset_type == "vehicle" else "vehicle"]
+    return ([f"{partner_label}: {interval.partner} ({format_timestamp(interval.start_at)} — "
+             f"{format_timestamp(interval.end_at)})" for interval in occupancy.couplings]
+            + [f"Kierowca: {interval.partner} ({format_timestamp(interval.start_at)} — "
+               f"{format_timestamp(interval.end_at)})" for interval in occupancy.drivers])
+
+# Окно запроса: день целиком для даты без времени, минута для момента времени, текущая минута по умолчанию
+def _time_window(start=None, end=None):
+    if not start:
+        moment = datetime.now().replace(second=0, microsecond=0)
+        return moment.strftime("%Y-%m-%d %H:%M"), (moment + timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M")
+    window_start = to_iso_timestamp(start)
+    if end:
+        return window_start, to_iso_timestamp(end)
+    step = timedelta(days=1) if ":" not in start else timedelta(minutes=1)
+    return window_start, (datetime.strptime(window_start, "%Y-%m-%d %H:%M") + step).strftime("%Y-%m-%d %H:%M")
+
+# Интервалы участника, пересекающиеся с [start, end): ближайший интервал, начатый не позже start,
+# и интервалы, начатые внутри окна. Стоимость зависит от размера ответа, а не от всей истории
+def _overlapping(conn, table, column, key, start, end):
+    return conn.execute(f"""
+        SELECT * FROM {table}
+        WHERE {column} = ? AND start_at < ? AND COALESCE(end_at, '{OPEN_END}') > ?
+          AND start_at >= COALESCE((SELECT start_at FROM {table} WHERE {column} = ? AND start_at <= ?
+                                    ORDER BY start_at DESC LIMIT 1), '')
+        ORDER BY start_at""", (key, end, start, key, start)).fetchall()
+
+def _driver_id(conn, name):
+    conn.execute("INSERT OR IGNORE INTO drivers (name) VALUES (?)", (name.strip(),))
+    return conn.execute("SELECT id FROM drivers WHERE name = ?", (name.strip(),)).fetchone()[0]
+
+# Запись интервала с проверкой, что ни у одного из участников нет пересекающегося интервала
+def _book_interval(table, resolve, start, end):
+    start_at = to_iso_timestamp(start)
+    end_at = to_iso_timestamp(end) if end else None
+    if end_at is not None and end_at <= start_at:
+        raise IntervalConflict("Koniec okresu musi być późniejszy niż początek", [])
+
+    def insert(conn):
+        keys = resolve(conn)
+        columns = INTERVAL_TABLES[table]
+        conflicts = [row for column, key in zip(columns, keys)
+                     for row in _overlapping(conn, table, column, key, start_at, end_at or OPEN_END)]
+        if conflicts:
+            periods = ", ".join(f"{format_timestamp(row[3])} — {format_timestamp(row[4])}" for row in conflicts)
+            raise IntervalConflict(f"Okres pokrywa się z istniejącym przypisaniem: {periods}", conflicts)
+        return conn.execute(f"INSERT INTO {table} ({', '.join(columns)}, start_at, end_at) VALUES (?, ?, ?, ?)",
+                            (*keys, start_at, end_at)).lastrowid
+
+    return get_repository().write(insert)
+
+# Сцепка тягача с прицепом на период; end=None — до отцепки
+def couple_trailer(vehicle_number, trailer_number, start, end=None):
+    return _book_interval("couplings", lambda conn: (_asset_id(conn, "vehicle", vehicle_number),
+                                                     _asset_id(conn, "trailer", trailer_number)), start, end)
+
+# Назначение водителя на тягач; водитель создаётся при первом назначении
+def assign_driver(vehicle_number, driver_name, start, end=None):
+    if not (driver_name or "").strip():
+        raise LookupError("Podaj imię i nazwisko kierowcy")
+    return _book_interval("driver_assignments", lambda conn: (_asset_id(conn, "vehicle", vehicle_number),
+                                                              _driver_id(conn, driver_name)), start, end)
+
+# Завершение открытой сцепки или назначения тягача в момент at
+def _close_interval(table, vehicle_number, at):
+    end_at = to_iso_timestamp(at)
+
+    def close(conn):
+        vehicle_id = _asset_id(conn, "vehicle", vehicle_number)
+        return conn.execute(f"UPDATE {table} SET end_at = ? WHERE vehicle_id = ? AND end_at IS NULL AND start_at < ?",
+                            (end_at, vehicle_id, end_at)).rowcount
+
+    return get_repository().write(close)
+
+def uncouple_trailer(vehicle_number, at):
+    return _close_interval("couplings", vehicle_number, at)
+
+def end_driver_assignment(vehicle_number, at):
+    return _close_interval("driver_assignments", vehicle_number, at)
+
+# Проверка двойного бронирования прицепа: сцепки, пересекающиеся с периодом
+def trailer_conflicts(trailer_number, start, end=None):
+    start_at = to_iso_timestamp(start)
+    end_at = to_iso_timestamp(end) if end else OPEN_END
+    with get_repository().connection() as conn:
+        trailer_id = _asset_id(conn, "trailer", trailer_number)
+        return [Interval(row[0], _asset_number(conn, "vehicle", row[1]), row[3], row[4])
+                for row in _overlapping(conn, "couplings", "trailer_id", trailer_id, start_at, end_at)]
+
+# Кто был сцеплен с активом и кто им управлял в заданный день или момент (по умолчанию — сейчас)
+def asset_occupancy(asset_type, number, start=None, end=None):
+    window_start, window_end = _time_window(start, end)
+    with get_repository().connection() as conn:
+        asset_id = _asset_id(conn, asset_type, number)
+        own_column, partner_column = ("vehicle_id", "trailer_id") if asset_type == "vehicle" else ("trailer_id", "vehicle_id")
+        couplings = _overlapping(conn, "couplings", own_column, asset_id, window_start, window_end)
+        if asset_type == "vehicle":
+            driver_sources = [(asset_id, window_start, window_end)]
+        else:
+            # Водители прицепа — водители тягача, к которому он был прицеплен, в пределах сцепки
+            driver_sources = [(row[1], max(window_start, row[3]), min(window_end, row[4] or OPEN_END))
+                              for row in couplings]
+        partner_type = "trailer" if asset_type == "vehicle" else "vehicle"
+        partner_index = INTERVAL_TABLES["couplings"].index(partner_column) + 1
+        partners = [Interval(row[0], _asset_number(conn, partner_type, row[partner_index]), row[3], row[4])
+                    for row in couplings]
+        drivers = [Interval(row[0], conn.execute("SELECT name FROM drivers WHERE id = ?", (row[2],)).fetchone()[0],
+                            row[3], row[4])
+                   for vehicle_id, source_start, source_end in driver_sources
+                   for row in _overlapping(conn, "driver_assignments", "vehicle_id", vehicle_id,
+                                           source_start, source_end)]
+    return Occupancy(partners, drivers)
 
 # Функция для очистки полей
 def clear_fields(*fields):
@@ -147,12 +1501,546 @@ def clear_fields(*fields):
         field.value = ""
     fields[0].page.update()
 
+# Лента изменений: после записи подписчики (сессии, планировщик) получают небольшие дельты
+# событий compliance_events и обновляют свои данные без повторного поиска
+ChangeEvent = namedtuple("ChangeEvent", "id asset_type asset_number event_kind due_date")
+FEED_RELOAD = "reload"
+CHANGE_FEED_RELOAD_THRESHOLD = 100
+
+class ChangeFeed:
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._dispatch, name="change-feed", daemon=True)
+        self._thread.start()
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    # callback(changes) получает список ChangeEvent (due_date=None — событие удалено) или FEED_RELOAD
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def publish(self, changes):
+        self._queue.put(changes)
+
+    # Рассылка в отдельном потоке, чтобы медленная сессия не задерживала запись
+    def _dispatch(self):
+        while True:
+            changes = self._queue.get()
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for callback in subscribers:
+                try:
+                    callback(changes)
+                except Exception:
+                    # Сессия, которая не может принять изменения (например, закрыта), отписывается
+                    with self._lock:
+                        if callback in self._subscribers:
+                            self._subscribers.remove(callback)
+
+
+_change_feed = None
+
+def get_change_feed():
+    global _change_feed
+    with _repository_lock:
+        if _change_feed is None:
+            _change_feed = ChangeFeed()
+        return _change_feed
+
+# Дельты для ленты изменений: текущие события сохранённых активов (один запрос по индексу на актив)
+def _publish_asset_changes(asset_type, plate_keys):
+    feed = get_change_feed()
+    if not feed.has_subscribers:
+        return
+    if len(plate_keys) > CHANGE_FEED_RELOAD_THRESHOLD:
+        feed.publish(FEED_RELOAD)
+        return
+    table, number_column, kinds = ASSET_TABLES[asset_type]
+    changes = []
+    with get_repository().connection() as conn:
+        for plate_key in dict.fromkeys(plate_keys):
+            asset = conn.execute(f"SELECT {number_column} FROM {table} WHERE plate_key = ?", (plate_key,)).fetchone()
+            if asset is None:
+                continue
+            current = {event_kind: (event_id, due_date) for event_id, event_kind, due_date in conn.execute('''
+                SELECT id, event_kind, due_date FROM compliance_events
+                WHERE asset_type = ? AND asset_number = ?''', (asset_type, asset[0]))}
+            for event_kind in kinds:
+                event_id, due_date = current.get(event_kind, (None, None))
+                changes.append(ChangeEvent(event_id, asset_type, asset[0], event_kind, due_date))
+    feed.publish(changes)
+
+add_asset_listener(_publish_asset_changes)
+
+# Планировщик напоминаний об окончании сроков: очередь с приоритетом (min-heap) по дате напоминания.
+# Загружается из compliance_events один раз и обновляется точечно из ленты изменений
+ALERT_LEAD_DAYS = (30, 14, 7, 1)
+ALERT_MAX_WAIT_SECONDS = 3600
+
+class ExpiryAlertScheduler:
+    def __init__(self, lead_days=ALERT_LEAD_DAYS):
+        self.lead_days = tuple(sorted(set(lead_days), reverse=True))
+        self._heap = []
+        self._due_dates = {}
+        self._subscribers = []
+        self._fired = []
+        self._last_run = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="expiry-alerts", daemon=True)
+        self.reload()
+        get_change_feed().subscribe(self.apply_changes)
+        self._thread.start()
+
+    # Полная загрузка предстоящих сроков одним диапазонным запросом по индексу due_date.
+    # Догоняются только напоминания, выпавшие после последнего прохода (alert_state.last_run)
+    def reload(self):
+        today = date.today().isoformat()
+        with get_repository().connection() as conn:
+            events = conn.execute('''
+                SELECT asset_type, asset_number, event_kind, due_date FROM compliance_events
+                WHERE due_date >= ?''', (today,)).fetchall()
+            state = conn.execute("SELECT last_run FROM alert_state").fetchone()
+        with self._condition:
+            self._last_run = state[0] if state else None
+            self._due_dates = {event[:3]: event[3] for event in events}
+            self._heap = [entry for event in events for entry in self._entries(event, today, self._last_run)]
+            heapq.heapify(self._heap)
+            self._condition.notify()
+
+    # Точечное обновление из ленты изменений: старые записи кучи отбрасываются при извлечении
+    def apply_changes(self, changes):
+        if changes == FEED_RELOAD:
+            self.reload()
+            return
+        today = date.today().isoformat()
+        with self._condition:
+            for change in changes:
+                key = (change.asset_type, change.asset_number, change.event_kind)
+                if change.due_date is None or change.due_date < today:
+                    self._due_dates.pop(key, None)
+                    continue
+                if self._due_dates.get(key) != change.due_date:
+                    self._due_dates[key] = change.due_date
+                    # Новый или перенесённый срок: его прошедшие напоминания ещё не показывались
+                    for entry in self._entries((*key, change.due_date), today, None):
+                        heapq.heappush(self._heap, entry)
+            self._condition.notify()
+
+    # Записи кучи для одного срока. Напоминания, чей день уже наступил, но позже since (последнего прохода;
+    # None — срок новый), сводятся в одно напоминание на сегодня с фактическим числом оставшихся дней.
+    # Строки с некорректной датой пропускаются, чтобы одна запись не останавливала загрузку
+    def _entries(self, event, today, since):
+        asset_type, asset_number, event_kind, due_date = event
+        try:
+            due = date.fromisoformat(due_date)
+        except (TypeError, ValueError):
+            logging.getLogger("fleet.alerts").warning("%s %s %s: nieprawidłowa data %r",
+                                                     asset_type, asset_number, event_kind, due_date)
+            return
+        days_left = (due - date.fromisoformat(today)).days
+        missed = False
+        for lead in self.lead_days:
+            alert_on = (due - timedelta(days=lead)).isoformat()
+            if alert_on > today:
+                yield alert_on, due_date, asset_type, asset_number, event_kind, lead
+            elif since is None or alert_on > since:
+                missed = True
+        if missed:
+            yield today, due_date, asset_type, asset_number, event_kind, days_left
+
+    # callback(alerts) получает список напоминаний; новые подписчики сразу получают сегодняшние напоминания
+    def subscribe(self, callback):
+        with self._condition:
+            self._subscribers.append(callback)
+            today = date.today().isoformat()
+            fired_today = [alert for alert in self._fired if alert[0] == today]
+        if fired_today:
+            callback(fired_today)
+
+        def unsubscribe():
+            with self._condition:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _run(self):
+        while True:
+            with self._condition:
+                today = date.today().isoformat()
+                alerts = []
+                # После reload() в тот же день записи появляются в куче снова; уже отправленные не повторяются
+                fired_today = {alert for alert in self._fired if alert[0] == today}
+                while self._heap and self._heap[0][0] <= today:
+                    entry = heapq.heappop(self._heap)
+                    if entry[0] < today:
+                        entry = (today, *entry[1:])
+                    if self._due_dates.get((entry[2], entry[3], entry[4])) == entry[1] and entry not in fired_today:
+                        fired_today.add(entry)
+                        alerts.append(entry)
+                new_day = self._last_run != today
+                self._last_run = today
+                if not alerts and not new_day:
+                    self._condition.wait(timeout=self._seconds_until_next_alert())
+                    continue
+                self._fired = [alert for alert in self._fired if alert[0] == today] + alerts
+                subscribers = list(self._subscribers) if alerts else []
+            if new_day:
+                self._save_last_run(today)
+            for callback in subscribers:
+                callback(alerts)
+
+    # Напоминания за день считаются показанными; при следующем запуске догоняются только более поздние
+    def _save_last_run(self, today):
+        try:
+            with get_repository().transaction() as conn:
+                conn.execute("INSERT INTO alert_state (id, last_run) VALUES (1, ?) "
+                             "ON CONFLICT (id) DO UPDATE SET last_run = excluded.last_run", (today,))
+        except sqlite3.Error as error:
+            logging.getLogger("fleet.alerts").warning("alert_state: %s", error)
+
+    def _seconds_until_next_alert(self):
+        if not self._heap:
+            return ALERT_MAX_WAIT_SECONDS
+        seconds = (datetime.fromisoformat(self._heap[0][0]) - datetime.now()).total_seconds()
+        return min(max(seconds, 1), ALERT_MAX_WAIT_SECONDS)
+
+
+# Текст напоминания для интерфейса
+def format_expiry_alert(alert):
+    _, due_date, asset_type, asset_number, event_kind, lead = alert
+    return (f"{ASSET_TYPE_LABELS.get(asset_type, asset_type)} {asset_number}: "
+            f"{EVENT_KIND_LABELS.get(event_kind, event_kind)} wygasa {format_date(due_date)} (za {lead} dni)")
+
+
+_alert_scheduler = None
+
+# Общий планировщик напоминаний для всех сессий
+def get_alert_scheduler(lead_days=None):
+    global _alert_scheduler
+    with _repository_lock:
+        if _alert_scheduler is None:
+            _alert_scheduler = ExpiryAlertScheduler(lead_days or ALERT_LEAD_DAYS)
+        return _alert_scheduler
+
+# Планирование визитов в мастерской: техосмотры и калибровки тахографов собираются в дни с ограниченной
+# вместимостью. Каждый визит ставится в самый поздний свободный рабочий день не позже срока (с запасом);
+# поиск свободного дня — система непересекающихся множеств, поэтому план на 20 тыс. активов строится за доли секунды
+WORKSHOP_EVENT_KINDS = ("inspection", "tachograph")
+WORKSHOP_DAILY_CAPACITY = 40
+WORKSHOP_WEEKDAYS = (0, 1, 2, 3, 4)
+WORKSHOP_HORIZON_DAYS = 90
+WORKSHOP_MARGIN_DAYS = 3
+# События одного актива со сроками в пределах этого окна объединяются в один визит
+WORKSHOP_MERGE_DAYS = 30
+
+WorkshopVisit = namedtuple("WorkshopVisit", "asset_type asset_number event_kinds due_date")
+WorkshopPlan = namedtuple("WorkshopPlan", "days capacity overdue unscheduled")
+
+# Визиты из событий, отсортированных по (тип, номер, срок): сроки одного актива в пределах окна — один визит
+def _workshop_visits(events, merge_days=WORKSHOP_MERGE_DAYS):
+    visits = []
+    current = None
+    for asset_type, asset_number, event_kind, due_date in events:
+        due = date.fromisoformat(due_date)
+        if current and current[:2] == (asset_type, asset_number) and (due - current[3]).days <= merge_days:
+            current[2].append(event_kind)
+            continue
+        current = [asset_type, asset_number, [event_kind], due]
+        visits.append(current)
+    return [WorkshopVisit(asset_type, asset_number, tuple(kinds), due) for asset_type, asset_number, kinds, due in visits]
+
+def plan_workshop(capacity=WORKSHOP_DAILY_CAPACITY, horizon_days=WORKSHOP_HORIZON_DAYS,
+                  margin_days=WORKSHOP_MARGIN_DAYS, weekdays=WORKSHOP_WEEKDAYS, today=None):
+    today = today or date.today()
+    end = today + timedelta(days=horizon_days)
+    kinds = ", ".join("?" * len(WORKSHOP_EVENT_KINDS))
+    with get_repository().connection() as conn:
+        events = conn.execute(f"""
+            SELECT asset_type, asset_number, event_kind, due_date FROM compliance_events
+            WHERE event_kind IN ({kinds}) AND due_date <= ?
+            ORDER BY asset_type, asset_number, due_date""", (*WORKSHOP_EVENT_KINDS, end.isoformat())).fetchall()
+    visits = _workshop_visits(events)
+    # Срок истекает сегодня или уже истёк: такие визиты не планируются, а показываются отдельно
+    overdue = [visit for visit in visits if visit.due_date <= today]
+
+    # Рабочие дни мастерской в горизонте планирования (начиная с завтрашнего дня)
+    days = [day for day in (today + timedelta(days=offset) for offset in range(1, horizon_days + 1))
+            if day.weekday() in weekdays]
+    free = [capacity] * len(days)
+    # parent[i + 1] указывает на ближайший день <= i, где ещё есть место; 0 — мест нет
+    parent = list(range(len(days) + 1))
+
+    def find(index):
+        root = index
+        while parent[root] != root:
+            root = parent[root]
+        while parent[index] != root:
+            parent[index], index = root, parent[index]
+        return root
+
+    booked = [[] for _ in days]
+    unscheduled = []
+    # Сначала визиты с более ранним сроком, чтобы при нехватке мест без визита оставались более поздние
+    for visit in sorted((visit for visit in visits if visit.due_date > today), key=lambda visit: visit.due_date):
+        # Последний свободный день с запасом margin_days; если такого нет — любой свободный день до срока.
+        # Визит, для которого до срока нет ни одного свободного рабочего дня, остаётся без места
+        slot = find(bisect.bisect_right(days, visit.due_date - timedelta(days=margin_days)))
+        if slot == 0:
+            slot = find(bisect.bisect_right(days, visit.due_date))
+        if slot == 0:
+            unscheduled.append(visit)
+            continue
+        booked[slot - 1].append(visit)
+        free[slot - 1] -= 1
+        if free[slot - 1] == 0:
+            parent[slot] = slot - 1
+    plan_days = OrderedDict((day, visits) for day, visits in zip(days, booked) if visits)
+    return WorkshopPlan(plan_days, capacity, overdue, unscheduled)
+
+# Общий пул потоков для работы с базой, чтобы обработчики Flet не блокировались на SQLite
+DB_WORKERS = 8
+MAX_QUERIES_PER_SESSION = 4
+_db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="fleet-db")
+
+# Выполнение запросов сессии в фоне: индикатор загрузки, отмена устаревших запросов и лимит одновременных запросов
+class SessionTaskRunner:
+    def __init__(self, page, max_in_flight=MAX_QUERIES_PER_SESSION):
+        self.page = page
+        self.progress = ft.ProgressRing(width=20, height=20, visible=False)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._futures = {}
+        self._in_flight = 0
+
+    # Запуск func в фоне; новый запрос с тем же ключом вытесняет предыдущий
+    def run(self, key, func, *args, on_success=None, on_error=None):
+        if not self._slots.acquire(blocking=False):
+            self.page.snack_bar = ft.SnackBar(ft.Text("Poczekaj na zakończenie poprzednich zapytań"))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return False
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            previous = self._futures.get(key)
+            self._in_flight += 1
+            self.progress.visible = True
+        if previous is not None:
+            previous.cancel()
+        future = _db_executor.submit(func, *args)
+        with self._lock:
+            if self._generations[key] == generation:
+                self._futures[key] = future
+        future.add_done_callback(lambda done: self._finish(key, generation, done, on_success, on_error))
+        self.page.update()
+        return True
+
+    # Результат возвращается в интерфейс только для последнего запроса с данным ключом
+    def _finish(self, key, generation, future, on_success, on_error):
+        self._slots.release()
+        with self._lock:
+            self._in_flight -= 1
+            self.progress.visible = self._in_flight > 0
+            is_current = self._generations.get(key) == generation
+            if is_current:
+                self._futures.pop(key, None)
+        if is_current and not future.cancelled():
+            error = future.exception()
+            if error is None:
+                if on_success is not None:
+                    on_success(future.result())
+            elif on_error is not None:
+                on_error(error)
+            else:
+                self.show_error(error)
+        self.page.update()
+
+    def show_error(self, error):
+        self.page.dialog = ft.AlertDialog(title=ft.Text("Błąd", size=18), content=ft.Text(str(error), size=18))
+        self.page.dialog.open = True
+
+# Панель результатов поиска по дате: страницы подгружаются из базы при прокрутке
+class EventResultsPanel:
+    COLUMN_LABELS = {"due_date": "Data", "asset_type": "Typ", "asset_number": "Numer", "event_kind": "Zdarzenie"}
+
+    def __init__(self, page, runner):
+        self.page = page
+        self.runner = runner
+        self.filters = None
+        self.sort_column = "due_date"
+        self.descending = False
+        self.last_key = None
+        self.exhausted = True
+        self.loading = False
+        self.rows = []
+        self._lock = threading.Lock()
+        self.summary = ft.Text(size=16)
+        self.header = ft.Row([
+            ft.TextButton(text=label, width=200, on_click=lambda e, column=column: self.sort_by(column))
+            for column, label in self.COLUMN_LABELS.items()
+        ])
+        self.list_view = ft.ListView(height=400, item_extent=32, on_scroll_interval=100, on_scroll=self._on_scroll)
+        self.control = ft.Column([self.summary, self.header, self.list_view], visible=False)
+
+    # Новый поиск: сброс списка и загрузка первой страницы
+    def show(self, start_date, end_date, event_kinds=None):
+        self.filters = (start_date, end_date, event_kinds)
+        self._reload()
+
+    # Сортировка выполняется базой: повторный клик по колонке меняет направление
+    def sort_by(self, column):
+        if self.filters is None:
+            return
+        self.descending = not self.descending if column == self.sort_column else False
+        self.sort_column = column
+        self._reload()
+
+    def _reload(self):
+        with self._lock:
+            self.rows.clear()
+            self.list_view.controls.clear()
+        self.last_key = None
+        self.exhausted = False
+        self.loading = False
+        for button, column in zip(self.header.controls, self.COLUMN_LABELS):
+            arrow = (" ↓" if self.descending else " ↑") if column == self.sort_column else ""
+            button.text = self.COLUMN_LABELS[column] + arrow
+        self.control.visible = True
+        self.load_next_page()
+
+    # Запрос следующей страницы в фоне; новый поиск вытесняет незавершённую загрузку
+    def load_next_page(self):
+        if self.exhausted or self.loading:
+            return
+        self.loading = self.runner.run(
+            "events_page", fetch_events_page, *self.filters, self.sort_column, self.descending, self.last_key,
+            on_success=self._append_rows, on_error=self._load_failed
+        )
+
+    def _append_rows(self, rows):
+        self.loading = False
+        with self._lock:
+            self.rows.extend(rows)
+            self.list_view.controls.extend(self._row_control(row) for row in rows)
+        self.exhausted = len(rows) < RESULTS_PAGE_SIZE
+        if rows:
+            self.last_key = self._sort_key(rows[-1])
+        self._update_summary()
+
+    def _update_summary(self):
+        loaded = len(self.rows)
+        self.summary.value = f"Wyniki: {loaded}" if self.exhausted else f"Wyniki: {loaded}+ (przewiń, aby załadować więcej)"
+        if not loaded:
+            self.summary.value = "Brak wyników"
+
+    def _sort_key(self, row):
+        return row[EVENT_PAGE_COLUMNS.index(self.sort_column)], row[0]
+
+    def _precedes(self, key, other):
+        return key > other if self.descending else key < other
+
+    # Изменения из ленты применяются к уже загруженным строкам на месте, без повторного запроса
+    def apply_changes(self, changes):
+        if self.filters is None:
+            return
+        if changes == FEED_RELOAD:
+            self._reload()
+            return
+        start_date, end_date, event_kinds = self.filters
+        start_date, end_date = to_iso_date(start_date), to_iso_date(end_date)
+        with self._lock:
+            for change in changes:
+                key = (change.asset_type, change.asset_number, change.event_kind)
+                for index, row in enumerate(self.rows):
+                    if row[1:4] == key:
+                        del self.rows[index]
+                        del self.list_view.controls[index]
+                        break
+                if change.due_date is None or not start_date <= change.due_date <= end_date:
+                    continue
+                if event_kinds and change.event_kind not in event_kinds:
+                    continue
+                row = (change.id, *key, change.due_date)
+                sort_key = self._sort_key(row)
+                # Строка за пределами загруженных страниц появится при прокрутке
+                if not self.exhausted and self.last_key is not None and self._precedes(self.last_key, sort_key):
+                    continue
+                index = next((index for index, loaded in enumerate(self.rows)
+                              if self._precedes(sort_key, self._sort_key(loaded))), len(self.rows))
+                self.rows.insert(index, row)
+                self.list_view.controls.insert(index, self._row_control(row))
+        self._update_summary()
+        self.page.update()
+
+    def _load_failed(self, error):
+        self.loading = False
+        self.runner.show_error(error)
+
+    def _row_control(self, row):
+        _, asset_type, asset_number, event_kind, due_date = row
+        values = (format_date(due_date), ASSET_TYPE_LABELS.get(asset_type, asset_type), asset_number,
+                  EVENT_KIND_LABELS.get(event_kind, event_kind))
+        return ft.Row([ft.Text(value, width=200, size=16) for value in values])
+
+    # Подгрузка следующей страницы при приближении к концу списка
+    def _on_scroll(self, e: ft.OnScrollEvent):
+        if e.pixels >= e.max_scroll_extent - 200:
+            self.load_next_page()
+
+# Режим веб-сервера: несколько диспетчеров одновременно, записи через единственного писателя.
+# Лимит сессий по умолчанию проверен нагрузочным тестом: python benchmark_fleet.py --load-test 12
+DEFAULT_MAX_SESSIONS = 12
+SERVER_POOL_SIZE = 8
+DEFAULT_PORT = 8550
+DIAGNOSTICS_TOP_QUERIES = 30
+SESSION_LIMIT_TEXT = "Osiągnięto limit jednoczesnych sesji. Spróbuj ponownie później."
+max_sessions = None
+# Лимит считает только подключённые сессии: Flet вызывает on_close лишь по истечении сессии,
+# поэтому место освобождается уже при on_disconnect (закрытие вкладки, обновление страницы)
+_live_sessions = set()
+_sessions_lock = threading.Lock()
+
+def open_session(session_id):
+    with _sessions_lock:
+        if session_id in _live_sessions:
+            return True
+        if max_sessions is not None and len(_live_sessions) >= max_sessions:
+            return False
+        _live_sessions.add(session_id)
+        return True
+
+def close_session(session_id):
+    with _sessions_lock:
+        _live_sessions.discard(session_id)
+
 # Основная функция приложения
 def main(page: ft.Page):
     page.title = "Management vehicles"
     page.window.resizable = True
     page.scroll = "adaptive"
 
+    if not open_session(page.session_id):
+        page.add(ft.Text(SESSION_LIMIT_TEXT, size=18))
+        return
+
     dark_mode = False
 
     # Функция для переключения темы
@@ -181,26 +2069,52 @@ def main(page: ft.Page):
     search_start_date = ft.TextField(label="Data początkowa (DD/MM/RRRR)")
     search_end_date = ft.TextField(label="Data końcowa (DD/MM/RRRR)")
 
+    # Zapytania do bazy wykonywane w tle oraz panel wyników wyszukiwania według daty
+    runner = SessionTaskRunner(page)
+    results_panel = EventResultsPanel(page, runner)
+
     # Funkcje dla przycisków
-    def save_vehicle_click(e):
-        save_or_update_vehicle(
-            vehicle_number.value, insurance_number.value, insurance_expiry.value,
-            inspection_expiry.value, tachograph_calibration.value
+    # Сообщение о неверном формате даты
+    def show_date_error():
+        page.dialog = ft.AlertDialog(
+            title=ft.Text("Błąd", size=18),
+            content=ft.Text("Nieprawidłowy format daty! Użyj DD/MM/RRRR.", size=18)
         )
-        clear_fields(vehicle_number, insurance_number, insurance_expiry, inspection_expiry, tachograph_calibration)
-        page.dialog = ft.AlertDialog(title=ft.Text("Dane pojazdu zostały pomyślnie zapisane/zaktualizowane!"))
         page.dialog.open = True
         page.update()
 
+    # Ошибка сохранения: неверная дата или ошибка базы данных
+    def show_save_error(error):
+        if isinstance(error, ValueError):
+            show_date_error()
+        else:
+            runner.show_error(error)
+
+    def save_vehicle_click(e):
+        def saved(_):
+            clear_fields(vehicle_number, insurance_number, insurance_expiry, inspection_expiry, tachograph_calibration)
+            page.dialog = ft.AlertDialog(title=ft.Text("Dane pojazdu zostały pomyślnie zapisane/zaktualizowane!"))
+            page.dialog.open = True
+
+        runner.run(
+            "save_vehicle", save_or_update_vehicle,
+            vehicle_number.value, insurance_number.value, insurance_expiry.value,
+            inspection_expiry.value, tachograph_calibration.value,
+            on_success=saved, on_error=show_save_error
+        )
+
     def save_trailer_click(e):
-        save_or_update_trailer(
+        def saved(_):
+            clear_fields(trailer_number, trailer_insurance_number, trailer_insurance_expiry, trailer_inspection_expiry)
+            page.dialog = ft.AlertDialog(title=ft.Text("Dane przyczepy zostały pomyślnie zapisane/zaktualizowane!"))
+            page.dialog.open = True
+
+        runner.run(
+            "save_trailer", save_or_update_trailer,
             trailer_number.value, trailer_insurance_number.value, trailer_insurance_expiry.value,
-            trailer_inspection_expiry.value
+            trailer_inspection_expiry.value,
+            on_success=saved, on_error=show_save_error
         )
-        clear_fields(trailer_number, trailer_insurance_number, trailer_insurance_expiry, trailer_inspection_expiry)
-        page.dialog = ft.AlertDialog(title=ft.Text("Dane przyczepy zostały pomyślnie zapisane/zaktualizowane!"))
-        page.dialog.open = True
-        page.update()
 
     def search_by_date_click(e):
         if not (is_valid_date(search_start_date.value) and is_valid_date(search_end_date.value)):
@@ -213,27 +2127,28 @@ def main(page: ft.Page):
             page.update()
             return
 
-        vehicles, trailers = search_by_date(search_start_date.value, search_end_date.value)
-        vehicle_data = "\n".join([f"Pojazd: {v[1]}, Ubezpieczenie: {v[2]}, Data wygaśnięcia ubezpieczenia: {v[3]}, "
-                                  f"Data wygaśnięcia przeglądu: {v[4]}, Data kalibracji tachografu: {v[5]}" for v in
-                                  vehicles])
-        trailer_data = "\n".join([f"Przyczepa: {t[1]}, Ubezpieczenie: {t[2]}, Data wygaśnięcia ubezpieczenia: {t[3]}, "
-                                  f"Data wygaśnięcia przeglądu: {t[4]}" for t in trailers])
-        content_text = f"Pojazdy:\n{vehicle_data or 'Brak wyników'}\n\nPrzyczepy:\n{trailer_data or 'Brak wyników'}"
-
+        results_panel.show(search_start_date.value, search_end_date.value)
         clear_fields(search_start_date, search_end_date)
-        page.dialog = ft.AlertDialog(
-            title=ft.Text("Wyniki wyszukiwania", size=18),  # Увеличенный шрифт заголовка
-            content=ft.Text(content_text, size=18)  # Увеличенный шрифт содержимого
-        )
-        page.dialog.open = True
-        page.update()
 
-    def search_vehicle_click(e):
-        result = search_vehicle_by_number(search_vehicle_number.value)
+    # Sprzęg i kierowca dopisywane do otwartego okna, gdy tylko zostaną wczytane
+    def show_occupancy(dialog, add_line, asset_type, number, on_date=None):
+        def loaded(occupancy):
+            if page.dialog is dialog:
+                for line in format_occupancy(asset_type, occupancy):
+                    add_line(line)
+
+        runner.run("occupancy", asset_occupancy, asset_type, number, on_date,
+                   on_success=loaded, on_error=lambda error: None)
+
+    def add_dialog_text(dialog):
+        def add_line(line):
+            dialog.content.value += "\n" + line
+        return add_line
+
+    def show_vehicle(result):
         if result:
-            vehicle_data = f"Numer pojazdu: {result[0][1]}\nUbezpieczenie: {result[0][2]}\nData wygaśnięcia ubezpieczenia: {result[0][3]}\n" \
-                           f"Data przeglądu: {result[0][4]}\nData kalibracji tachografu: {result[0][5]}"
+            vehicle_data = f"Numer pojazdu: {result[0][1]}\nUbezpieczenie: {result[0][2]}\nData wygaśnięcia ubezpieczenia: {format_date(result[0][3])}\n" \
+                           f"Data przeglądu: {format_date(result[0][4])}\nData kalibracji tachografu: {format_date(result[0][5])}"
             page.dialog = ft.AlertDialog(
                 title=ft.Text("Informacje o pojeździe", size=18),
                 content=ft.Text(vehicle_data, size=18)  # увеличенный шрифт
@@ -245,13 +2160,16 @@ def main(page: ft.Page):
             )
         clear_fields(search_vehicle_number)
         page.dialog.open = True
-        page.update()
+        if result:
+            show_occupancy(page.dialog, add_dialog_text(page.dialog), "vehicle", result[0][1])
 
-    def search_trailer_click(e):
-        result = search_trailer_by_number(search_trailer_number.value)
+    def search_vehicle_click(e):
+        runner.run("search_vehicle", search_vehicle_by_number, search_vehicle_number.value, on_success=show_vehicle)
+
+    def show_trailer(result):
         if result:
-            trailer_data = f"Numer przyczepy: {result[0][1]}\nUbezpieczenie: {result[0][2]}\nData wygaśnięcia ubezpieczenia: {result[0][3]}\n" \
-                           f"Data przeglądu: {result[0][4]}"
+            trailer_data = f"Numer przyczepy: {result[0][1]}\nUbezpieczenie: {result[0][2]}\nData wygaśnięcia ubezpieczenia: {format_date(result[0][3])}\n" \
+                           f"Data przeglądu: {format_date(result[0][4])}"
             page.dialog = ft.AlertDialog(
                 title=ft.Text("Informacje o przyczepie", size=18),  # Увеличенный шрифт заголовка
                 content=ft.Text(trailer_data, size=18)  # Увеличенный шрифт содержимого
@@ -263,23 +2181,444 @@ def main(page: ft.Page):
             )
         clear_fields(search_trailer_number)
         page.dialog.open = True
+        if result:
+            show_occupancy(page.dialog, add_dialog_text(page.dialog), "trailer", result[0][1])
+
+    def search_trailer_click(e):
+        runner.run("search_trailer", search_trailer_by_number, search_trailer_number.value, on_success=show_trailer)
+
+    # Sprzęg z przyczepą i przypisanie kierowcy do pojazdu z pola numeru pojazdu
+    coupling_trailer_number = ft.TextField(label="Numer przyczepy do sprzęgu")
+    driver_name = ft.TextField(label="Kierowca")
+    period_start = ft.TextField(label="Od (DD/MM/RRRR [GG:MM])")
+    period_end = ft.TextField(label="Do (DD/MM/RRRR [GG:MM], opcjonalnie)")
+
+    def booked(message, *fields):
+        def done(_):
+            clear_fields(*fields)
+            page.snack_bar = ft.SnackBar(ft.Text(message))
+            page.snack_bar.open = True
+        return done
+
+    def couple_trailer_click(e):
+        runner.run("couple_trailer", couple_trailer, vehicle_number.value, coupling_trailer_number.value,
+                   period_start.value, period_end.value or None,
+                   on_success=booked("Przyczepa została sprzęgnięta", coupling_trailer_number, period_start, period_end),
+                   on_error=show_save_error)
+
+    def assign_driver_click(e):
+        runner.run("assign_driver", assign_driver, vehicle_number.value, driver_name.value,
+                   period_start.value, period_end.value or None,
+                   on_success=booked("Kierowca został przypisany", driver_name, period_start, period_end),
+                   on_error=show_save_error)
+
+    def uncouple_trailer_click(e):
+        runner.run("uncouple_trailer", uncouple_trailer, vehicle_number.value, period_start.value,
+                   on_success=booked("Sprzęg został zakończony", period_start), on_error=show_save_error)
+
+    # Historia polis i terminów (z datą — stan na dany dzień) oraz dokumenty pojazdu lub przyczepy
+    history_asset_type = ft.Dropdown(
+        value="vehicle", options=[ft.dropdown.Option(key, label) for key, label in ASSET_TYPE_LABELS.items()]
+    )
+    history_number = ft.TextField(label="Numer pojazdu lub przyczepy")
+    history_date = ft.TextField(label="Stan na dzień (DD/MM/RRRR, opcjonalnie)")
+
+    def format_history_entry(entry):
+        lines = [f"Numer: {entry.asset_number}", f"Ubezpieczenie: {entry.insurance_number}",
+                 f"Data wygaśnięcia ubezpieczenia: {format_date(entry.insurance_expiry)}",
+                 f"Data przeglądu: {format_date(entry.inspection_expiry)}"]
+        if entry.tachograph_calibration is not None:
+            lines.append(f"Data kalibracji tachografu: {format_date(entry.tachograph_calibration)}")
+        valid_from = "od początku" if entry.valid_from == HISTORY_EPOCH else entry.valid_from[:16]
+        valid_to = entry.valid_to[:16] if entry.valid_to else "obecnie"
+        lines.append(f"Obowiązuje: {valid_from} — {valid_to}")
+        return "\n".join(lines)
+
+    def show_history(entries):
+        if not entries:
+            page.dialog = ft.AlertDialog(
+                title=ft.Text("Błąd", size=18),
+                content=ft.Text("Brak historii dla podanego numeru i daty!", size=18)
+            )
+        else:
+            page.dialog = ft.AlertDialog(
+                title=ft.Text(f"Historia: {entries[0].asset_number}", size=18),
+                content=ft.ListView(
+                    [ft.Text(format_history_entry(entry), size=16) for entry in entries],
+                    spacing=15, width=500, height=400
+                )
+            )
+        page.dialog.open = True
+
+    def history_click(e):
+        if history_date.value:
+            if not is_valid_date(history_date.value):
+                show_date_error()
+                return
+            def shown(entry):
+                show_history([entry] if entry else [])
+                if entry:
+                    dialog = page.dialog
+                    show_occupancy(dialog, lambda line: dialog.content.controls.append(ft.Text(line, size=16)),
+                                   history_asset_type.value, entry.asset_number, history_date.value)
+
+            runner.run("history", as_of, history_number.value, history_date.value, history_asset_type.value,
+                       on_success=shown)
+        else:
+            runner.run("history", asset_history, history_number.value, history_asset_type.value,
+                       on_success=show_history)
+
+    # Dokumenty: lista pokazuje tylko metadane z bazy, miniatura powstaje dopiero po kliknięciu
+    document_kind = ft.Dropdown(
+        value="insurance", options=[ft.dropdown.Option(key, label) for key, label in DOCUMENT_KINDS.items()]
+    )
+    exported_document = None
+
+    def show_document_preview(document):
+        def previewed(thumbnail):
+            content = [ft.Text(f"{DOCUMENT_KINDS.get(document.document_kind, document.document_kind)}, "
+                               f"{document.size // 1024} KB, dodano {document.added_at}", size=16)]
+            if thumbnail:
+                content.insert(0, ft.Image(src_base64=base64.b64encode(thumbnail).decode("ascii")))
+            page.dialog = ft.AlertDialog(
+                title=ft.Text(document.file_name, size=18),
+                content=ft.Column(content, tight=True),
+                actions=[
+                    ft.TextButton("Zapisz jako...", on_click=lambda e: save_document(document)),
+                    ft.TextButton("Usuń", on_click=lambda e: remove_document(document)),
+                ]
+            )
+            page.dialog.open = True
+
+        runner.run("document_preview", document_thumbnail, document.sha256, on_success=previewed)
+
+    def show_documents(documents):
+        if not documents:
+            page.dialog = ft.AlertDialog(
+                title=ft.Text("Dokumenty", size=18),
+                content=ft.Text("Brak dokumentów dla podanego numeru!", size=18)
+            )
+        else:
+            page.dialog = ft.AlertDialog(
+                title=ft.Text(f"Dokumenty: {history_number.value}", size=18),
+                content=ft.ListView(
+                    [
+                        ft.ListTile(
+                            title=ft.Text(document.file_name, size=16),
+                            subtitle=ft.Text(f"{DOCUMENT_KINDS.get(document.document_kind, document.document_kind)}"
+                                             f" — {document.added_at}"),
+                            on_click=lambda e, document=document: show_document_preview(document)
+                        )
+                        for document in documents
+                    ],
+                    width=500, height=400
+                )
+            )
+        page.dialog.open = True
+
+    def documents_click(e):
+        runner.run("documents", list_documents, history_asset_type.value, history_number.value,
+                   on_success=show_documents)
+
+    def attach_file_result(e: ft.FilePickerResultEvent):
+        if not e.files:
+            return
+
+        def attached(_):
+            page.snack_bar = ft.SnackBar(ft.Text(f"Dołączono dokument: {e.files[0].name}"))
+            page.snack_bar.open = True
+
+        runner.run("attach_document", attach_document, history_asset_type.value, history_number.value,
+                   document_kind.value, e.files[0].path, e.files[0].name, on_success=attached)
+
+    def save_document(document):
+        nonlocal exported_document
+        exported_document = document
+        save_document_picker.save_file(file_name=document.file_name)
+
+    def save_document_result(e: ft.FilePickerResultEvent):
+        if e.path and exported_document:
+            runner.run("export_document", get_document_store().export, exported_document.sha256, e.path)
+
+    def remove_document(document):
+        runner.run("detach_document", detach_document, document.id, on_success=lambda _: documents_click(None))
+
+    attach_file_picker = ft.FilePicker(on_result=attach_file_result)
+    save_document_picker = ft.FilePicker(on_result=save_document_result)
+    page.overlay.extend([attach_file_picker, save_document_picker])
+
+    # Plan wizyt w warsztacie: kalendarz dni roboczych z liczbą zarezerwowanych miejsc
+    workshop_capacity = ft.TextField(label="Miejsc w warsztacie na dzień", value=str(WORKSHOP_DAILY_CAPACITY))
+
+    def show_workshop_visits(title, visits):
+        page.dialog = ft.AlertDialog(
+            title=ft.Text(title, size=18),
+            content=ft.ListView(
+                [
+                    ft.ListTile(
+                        title=ft.Text(f"{ASSET_TYPE_LABELS[visit.asset_type]} {visit.asset_number}", size=16),
+                        subtitle=ft.Text(", ".join(EVENT_KIND_LABELS[kind] for kind in visit.event_kinds)
+                                         + f" — termin {visit.due_date.strftime('%d/%m/%Y')}")
+                    )
+                    for visit in visits
+                ],
+                width=500, height=400
+            )
+        )
+        page.dialog.open = True
+        page.update()
+
+    def workshop_day_cell(day, plan):
+        visits = plan.days.get(day, [])
+        load = len(visits) / plan.capacity
+        return ft.Container(
+            ft.Column([ft.Text(day.strftime("%d/%m"), weight=ft.FontWeight.BOLD),
+                       ft.Text(f"{len(visits)}/{plan.capacity}")], tight=True),
+            width=80, padding=5, border=ft.border.all(1, "grey"),
+            bgcolor="red100" if load >= 1 else "amber100" if load >= 0.5 else "green100" if visits else None,
+            on_click=(lambda e: show_workshop_visits(f"Warsztat {day.strftime('%d/%m/%Y')}", visits)) if visits else None
+        )
+
+    def show_workshop_plan(plan):
+        weeks = []
+        if plan.days:
+            first, last = next(iter(plan.days)), next(reversed(plan.days))
+            monday = first - timedelta(days=first.weekday())
+            while monday <= last:
+                weeks.append(ft.Row([workshop_day_cell(monday + timedelta(days=weekday), plan)
+                                     for weekday in WORKSHOP_WEEKDAYS]))
+                monday += timedelta(weeks=1)
+        summary = ft.Row([
+            ft.TextButton(f"Po terminie: {len(plan.overdue)}",
+                          on_click=lambda e: show_workshop_visits("Po terminie", plan.overdue)),
+            ft.TextButton(f"Bez wolnego miejsca: {len(plan.unscheduled)}",
+                          on_click=lambda e: show_workshop_visits("Bez wolnego miejsca", plan.unscheduled)),
+        ])
+        page.dialog = ft.AlertDialog(
+            title=ft.Text("Plan warsztatu", size=18),
+            content=ft.Column([summary, *weeks], scroll=ft.ScrollMode.AUTO, width=460, height=500)
+        )
+        page.dialog.open = True
+
+    def plan_workshop_click(e):
+        try:
+            capacity = int(workshop_capacity.value)
+        except ValueError:
+            capacity = 0
+        if capacity <= 0:
+            runner.show_error(ValueError("Liczba miejsc musi być dodatnią liczbą całkowitą"))
+            page.update()
+            return
+        runner.run("plan_workshop", plan_workshop, capacity, on_success=show_workshop_plan)
+
+    # Wyszukiwanie numeru w trakcie pisania: zapytanie wysyłane po krótkiej przerwie w pisaniu
+    plate_search_timer = None
+
+    def plate_search_changed(e):
+        nonlocal plate_search_timer
+        if plate_search_timer is not None:
+            plate_search_timer.cancel()
+        plate_search_timer = threading.Timer(
+            PLATE_SEARCH_DEBOUNCE_SECONDS, runner.run, args=("plate_search", search_plates, e.control.value),
+            kwargs={"on_success": show_plate_suggestions}
+        )
+        plate_search_timer.daemon = True
+        plate_search_timer.start()
+
+    def show_plate_suggestions(matches):
+        plate_suggestions.controls = [
+            ft.ListTile(
+                title=ft.Text(number, size=16),
+                subtitle=ft.Text(ASSET_TYPE_LABELS[asset_type]),
+                on_click=lambda e, asset_type=asset_type, number=number: open_asset(asset_type, number)
+            )
+            for asset_type, number in matches
+        ]
+
+    def open_asset(asset_type, number):
+        if asset_type == "vehicle":
+            runner.run("search_vehicle", search_vehicle_by_number, number, on_success=show_vehicle)
+        else:
+            runner.run("search_trailer", search_trailer_by_number, number, on_success=show_trailer)
+
+    plate_search_field = ft.TextField(label="Szukaj numeru (pojazd/przyczepa)", on_change=plate_search_changed)
+    plate_suggestions = ft.Column()
+
+    # Przypomnienia o kończących się terminach
+    def show_expiry_alerts(alerts):
+        lines = [format_expiry_alert(alert) for alert in alerts[:5]]
+        if len(alerts) > 5:
+            lines.append(f"... i {len(alerts) - 5} więcej")
+        page.snack_bar = ft.SnackBar(ft.Text("\n".join(lines)), duration=10000)
+        page.snack_bar.open = True
         page.update()
 
+    # Ukryty panel diagnostyczny (Ctrl+Shift+D): statystyki zapytań i pamięci podręcznej rekordów
+    def show_diagnostics():
+        cache = record_cache.stats()
+        query_rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(fingerprint[:80], size=12, tooltip=fingerprint)),
+                ft.DataCell(ft.Text(str(stats["count"]))),
+                ft.DataCell(ft.Text(f"{stats['total_ms'] / stats['count']:.2f}")),
+                ft.DataCell(ft.Text(f"{stats['max_ms']:.2f}")),
+                ft.DataCell(ft.Text(str(stats["rows"]))),
+                ft.DataCell(ft.Text(format_histogram(stats["histogram"]), size=12)),
+            ])
+            for fingerprint, stats in query_stats.snapshot()[:DIAGNOSTICS_TOP_QUERIES]
+        ]
+        page.dialog = ft.AlertDialog(
+            title=ft.Text("Diagnostyka", size=18),
+            content=ft.Column(
+                [
+                    ft.Text(f"Cache rekordów: {cache['size']}/{cache['max_size']}, trafienia {cache['hits']}, "
+                            f"chybienia {cache['misses']}, usunięcia {cache['evictions']}, "
+                            f"skuteczność {cache['hit_ratio']:.0%}"),
+                    ft.Text(f"Wolne zapytania (≥ {SLOW_QUERY_MS:.0f} ms) są zapisywane w {SLOW_QUERY_LOG_FILE}"),
+                    ft.DataTable(
+                        columns=[ft.DataColumn(ft.Text(label)) for label in
+                                 ("Zapytanie", "Liczba", "Śr. ms", "Maks. ms", "Wiersze", "Histogram")],
+                        rows=query_rows
+                    ),
+                ],
+                scroll="auto", width=1100, height=600
+            )
+        )
+        page.dialog.open = True
+        page.update()
+
+    def keyboard_event(e: ft.KeyboardEvent):
+        if e.ctrl and e.shift and e.key.upper() == "D":
+            show_diagnostics()
+
+    page.on_keyboard_event = keyboard_event
+
+    unsubscribe_alerts = get_alert_scheduler().subscribe(show_expiry_alerts)
+    unsubscribe_changes = get_change_feed().subscribe(results_panel.apply_changes)
+
+    # Rozłączenie (zamknięcie karty, odświeżenie) zwalnia miejsce w limicie sesji od razu
+    def session_disconnected(e):
+        close_session(page.session_id)
+
+    # Ponowne połączenie tej samej sesji zajmuje miejsce, o ile limit na to pozwala
+    def session_reconnected(e):
+        if not open_session(page.session_id):
+            page.clean()
+            page.add(ft.Text(SESSION_LIMIT_TEXT, size=18))
+
+    # Wygaśnięcie sesji: rezygnacja z przypomnień i zmian
+    def session_closed(e):
+        unsubscribe_alerts()
+        unsubscribe_changes()
+        close_session(page.session_id)
+
+    page.on_disconnect = session_disconnected
+    page.on_connect = session_reconnected
+    page.on_close = session_closed
+
     # Przycisk
     save_vehicle_button = ft.ElevatedButton(text="Zapisz/Zaktualizuj pojazd", on_click=save_vehicle_click)
+    couple_trailer_button = ft.ElevatedButton(text="Sprzęgnij przyczepę", on_click=couple_trailer_click)
+    uncouple_trailer_button = ft.ElevatedButton(text="Zakończ sprzęg", on_click=uncouple_trailer_click)
+    assign_driver_button = ft.ElevatedButton(text="Przypisz kierowcę", on_click=assign_driver_click)
     save_trailer_button = ft.ElevatedButton(text="Zapisz/Zaktualizuj przyczepę", on_click=save_trailer_click)
     search_by_date_button = ft.ElevatedButton(text="Wyszukaj według daty", on_click=search_by_date_click)
     search_vehicle_button = ft.ElevatedButton(text="Wyszukaj pojazd", on_click=search_vehicle_click)
     search_trailer_button = ft.ElevatedButton(text="Wyszukaj przyczepę", on_click=search_trailer_click)
+    history_button = ft.ElevatedButton(text="Pokaż historię", on_click=history_click)
+    documents_button = ft.ElevatedButton(text="Pokaż dokumenty", on_click=documents_click)
+    plan_workshop_button = ft.ElevatedButton(text="Zaplanuj warsztat", on_click=plan_workshop_click)
+    attach_document_button = ft.ElevatedButton(
+        text="Dołącz dokument", on_click=lambda e: attach_file_picker.pick_files(allow_multiple=False)
+    )
     toggle_theme_button = ft.ElevatedButton(text="light/dark", on_click=toggle_dark_mode)
 
+    # Массовый импорт флоты из файла
+    def import_file_result(e: ft.FilePickerResultEvent):
+        if not e.files:
+            return
+
+        def imported(report):
+            page.dialog = ft.AlertDialog(
+                title=ft.Text("Import zakończony", size=18),
+                content=ft.Text(format_import_report(report), size=18)
+            )
+            page.dialog.open = True
+
+        runner.run("import", import_fleet, e.files[0].path, on_success=imported)
+
+    import_file_picker = ft.FilePicker(on_result=import_file_result)
+    page.overlay.append(import_file_picker)
+    import_button = ft.ElevatedButton(
+        text="Importuj flotę (CSV/XLSX)",
+        on_click=lambda e: import_file_picker.pick_files(allowed_extensions=["csv", "xlsx"])
+    )
+
+    # Eksport danych do CSV/XLSX w tle z paskiem postępu
+    export_kind = ft.Dropdown(
+        width=240, value="vehicles",
+        options=[ft.dropdown.Option(key, label) for key, label in EXPORT_LABELS.items()]
+    )
+    export_progress = ft.ProgressBar(width=200, value=0, visible=False)
+
+    def export_progress_changed(written, total):
+        export_progress.value = written / total if total else None
+        page.update()
+
+    def export_file_result(e: ft.FilePickerResultEvent):
+        if not e.path:
+            return
+
+        def exported(rows):
+            export_progress.visible = False
+            page.dialog = ft.AlertDialog(
+                title=ft.Text("Eksport zakończony", size=18),
+                content=ft.Text(f"Zapisano {rows} wierszy do {e.path}", size=18)
+            )
+            page.dialog.open = True
+
+        def export_failed(error):
+            export_progress.visible = False
+            runner.show_error(error)
+
+        export_progress.value = 0
+        export_progress.visible = True
+        start_date, end_date = export_range()
+        runner.run("export", export_data, export_kind.value, e.path, start_date, end_date, export_progress_changed,
+                   on_success=exported, on_error=export_failed)
+
+    # Zakres eksportu: daty wpisane w polach wyszukiwania, a gdy są puste — zakres ostatniego wyszukiwania
+    # (search_by_date_click czyści pola po uruchomieniu wyszukiwania)
+    def export_range():
+        if search_start_date.value or search_end_date.value:
+            return search_start_date.value or None, search_end_date.value or None
+        if results_panel.filters is not None:
+            return results_panel.filters[:2]
+        return None, None
+
+    def export_click(e):
+        start_date, end_date = export_range()
+        if export_kind.value == "events" and not (is_valid_date(start_date or "") and is_valid_date(end_date or "")):
+            show_date_error()
+            return
+        export_file_picker.save_file(file_name=f"{export_kind.value}.csv", allowed_extensions=["csv", "xlsx"])
+
+    export_file_picker = ft.FilePicker(on_result=export_file_result)
+    page.overlay.append(export_file_picker)
+    export_button = ft.ElevatedButton(text="Eksportuj (CSV/XLSX)", on_click=export_click)
+
     page.add(
         ft.Column(
             [
                 ft.Row(
                     [
                         toggle_theme_button,  # Переключение темы
-                        ft.Text("Management vehicles", size=24)
+                        ft.Text("Management vehicles", size=24),
+                        runner.progress,
+                        import_button,
+                        export_kind,
+                        export_button,
+                        export_progress
                     ],
                     alignment=ft.MainAxisAlignment.SPACE_BETWEEN
                 ),
@@ -296,6 +2635,13 @@ def main(page: ft.Page):
                                         inspection_expiry,
                                         tachograph_calibration,
                                         save_vehicle_button,
+                                        ft.Divider(),
+                                        coupling_trailer_number,
+                                        driver_name,
+                                        period_start,
+                                        period_end,
+                                        ft.Row([couple_trailer_button, uncouple_trailer_button]),
+                                        assign_driver_button,
                                     ],
                                     alignment=ft.MainAxisAlignment.CENTER  # Центрируем по горизонтали
                                 ),
@@ -319,6 +2665,9 @@ def main(page: ft.Page):
                                 ft.Column(
                                     [
                                         ft.Text("Search", size=20, weight=ft.FontWeight.BOLD),
+                                        plate_search_field,
+                                        plate_suggestions,
+                                        ft.Divider(),
                                         search_vehicle_number,
                                         search_vehicle_button,
                                         search_trailer_number,
@@ -328,6 +2677,16 @@ def main(page: ft.Page):
                                         search_end_date,
                                         search_by_date_button,
                                         ft.Divider(),
+                                        history_asset_type,
+                                        history_number,
+                                        history_date,
+                                        history_button,
+                                        document_kind,
+                                        attach_document_button,
+                                        documents_button,
+                                        ft.Divider(),
+                                        workshop_capacity,
+                                        plan_workshop_button,
                                     ],
                                     alignment=ft.MainAxisAlignment.CENTER  # Центрируем по горизонтали
                                 ),
@@ -339,12 +2698,54 @@ def main(page: ft.Page):
                     padding=10,
                     border=ft.border.all(3, "red"),  # Общая красная рамка
                     border_radius=ft.border_radius.all(10)  # Закругленные углы для рамки
-                )
+                ),
+                results_panel.control
             ]
         )
     )
 
 # Инициализация базы данных и запуск приложения
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Management vehicles")
+    parser.add_argument("--import", dest="import_path", metavar="FILE",
+                        help="zaimportuj pojazdy lub przyczepy z pliku CSV/XLSX bez uruchamiania interfejsu")
+    parser.add_argument("--export", choices=list(EXPORT_KINDS),
+                        help="wyeksportuj dane do pliku podanego w --output bez uruchamiania interfejsu")
+    parser.add_argument("--output", metavar="FILE", help="plik eksportu (.csv lub .xlsx)")
+    parser.add_argument("--from", dest="start_date", metavar="DD/MM/RRRR", help="początek zakresu dla --export events")
+    parser.add_argument("--to", dest="end_date", metavar="DD/MM/RRRR", help="koniec zakresu dla --export events")
+    parser.add_argument("--alert-days", type=lambda value: [int(day) for day in value.split(",")],
+                        default=list(ALERT_LEAD_DAYS), metavar="30,14,7,1",
+                        help="ile dni przed terminem wyświetlać przypomnienia")
+    parser.add_argument("--slow-query-ms", type=float, default=SLOW_QUERY_MS,
+                        help=f"próg zapisu zapytania w {SLOW_QUERY_LOG_FILE} (ms)")
+    parser.add_argument("--web", action="store_true",
+                        help="uruchom jako serwer WWW dla wielu dyspozytorów (WAL, jeden wątek zapisu)")
+    parser.add_argument("--host", default=None, help="adres serwera WWW")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port serwera WWW")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS,
+                        help="maksymalna liczba jednoczesnych sesji w trybie --web")
+    args = parser.parse_args()
+
+    SLOW_QUERY_MS = args.slow_query_ms
+    if args.web:
+        use_database(DATABASE_FILE, pool_size=SERVER_POOL_SIZE, single_writer=True)
+        max_sessions = args.max_sessions
     init_db()
-    ft.app(target=main)
\ No newline at end of file
+    try:
+        if args.import_path:
+            print(format_import_report(import_fleet(args.import_path)))
+        elif args.export:
+            if not args.output:
+                parser.error("--export wymaga --output")
+            if args.export == "events" and not (args.start_date and args.end_date):
+                parser.error("--export events wymaga --from i --to")
+            print(f"Zapisano {export_data(args.export, args.output, args.start_date, args.end_date)} wierszy")
+        elif args.web:
+            get_alert_scheduler(args.alert_days).start()
+            ft.app(target=main, view=ft.AppView.WEB_BROWSER, host=args.host, port=args.port)
+        else:
+            get_alert_scheduler(args.alert_days).start()
+            ft.app(target=main)
+    finally:
+        get_repository().close()
\ No newline at end of file
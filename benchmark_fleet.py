@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import partial
+
+import Management_vehicles_FLET_app as fleet
+
+# Бенчмарк функций работы с данными Management_vehicles_FLET_app на синтетическом парке.
+# Пример: python benchmark_fleet.py --sizes 10000 100000 --output bench.json
+# Нагрузочный тест режима --web (N диспетчеров одновременно): python benchmark_fleet.py --load-test 12
+
+DEFAULT_SIZES = (10000, 100000)
+DEFAULT_QUERIES = 200
+LOAD_CHUNK_SIZE = 5000
+LOAD_TEST_SIZE = 10000
+LOAD_TEST_SECONDS = 30
+LOAD_TEST_WRITE_SHARE = 0.2
+# Опорная дата синтетического парка: от неё отсчитываются сроки и окна поиска, поэтому парк и результаты
+# не зависят от дня запуска и сравнимы между коммитами
+ANCHOR_DATE = date(2026, 1, 1)
+PLATE_REGIONS = ("WGM", "WA", "WX", "PO", "KR", "DW", "GD", "LU", "SK", "ZS", "EL", "BI", "OP", "RZ", "TK", "NT")
+
+
+# Детерминированный генератор парка: номера в польском формате и реалистичные даты окончания сроков
+class FleetGenerator:
+    def __init__(self, seed, today=ANCHOR_DATE):
+        self.random = random.Random(seed)
+        self.today = today
+
+    def plate(self, index):
+        region = PLATE_REGIONS[index % len(PLATE_REGIONS)]
+        return f"{region} {index:06d}{chr(65 + index * 7 % 26)}"
+
+    # Полис годовой, техосмотр годовой, калибровка тахографа раз в два года;
+    # небольшая часть сроков уже просрочена, часть полей не заполнена
+    def expiry(self, period_days, blank_share=0.02):
+        if self.random.random() < blank_share:
+            return ""
+        due = self.today + timedelta(days=self.random.randint(-30, period_days))
+        return due.strftime("%d/%m/%Y")
+
+    def vehicles(self, count):
+        for index in range(count):
+            yield (self.plate(index), f"POL/{self.random.randrange(10 ** 8):08d}",
+                   self.expiry(365), self.expiry(365), self.expiry(730))
+
+    def trailers(self, count):
+        for index in range(count):
+            yield (self.plate(index + 10 ** 6), f"POL/{self.random.randrange(10 ** 8):08d}",
+                   self.expiry(365), self.expiry(365))
+
+    def date_window(self, max_days=30):
+        start = self.today + timedelta(days=self.random.randint(0, 365))
+        end = start + timedelta(days=self.random.randint(1, max_days))
+        return start.strftime("%d/%m/%Y"), end.strftime("%d/%m/%Y")
+
+
+# Перцентили задержек в миллисекундах и пропускная способность
+def summarize(latencies):
+    ordered = sorted(latencies)
+
+    def percentile(share):
+        return ordered[min(len(ordered) - 1, int(share * len(ordered)))] * 1000
+
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "ops_per_second": len(ordered) / total if total else 0.0,
+    }
+
+
+def measure(func, argument_sets):
+    latencies = []
+    for arguments in argument_sets:
+        started = time.perf_counter()
+        func(*arguments)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def load_fleet(generator, size):
+    started = time.perf_counter()
+    vehicles = generator.vehicles(size)
+    trailers = generator.trailers(size)
+    for records, save_many in ((vehicles, fleet.save_many_vehicles), (trailers, fleet.save_many_trailers)):
+        while True:
+            chunk = [record for _, record in zip(range(LOAD_CHUNK_SIZE), records)]
+            if not chunk:
+                break
+            save_many(chunk)
+    seconds = time.perf_counter() - started
+    return {"assets": 2 * size, "seconds": seconds, "rows_per_second": 2 * size / seconds}
+
+
+# Прогон всех функций для одного размера парка во временной базе
+def run_size(size, queries, seed, anchor_date=ANCHOR_DATE):
+    generator = FleetGenerator(seed, anchor_date)
+    with tempfile.TemporaryDirectory() as directory:
+        fleet.use_database(os.path.join(directory, "benchmark.db"))
+        fleet.init_db()
+        results = {"bulk_load": load_fleet(generator, size)}
+
+        plates = [generator.plate(generator.random.randrange(size)) for _ in range(queries)]
+        windows = [generator.date_window() for _ in range(queries)]
+        partial_plates = [plate.replace(" ", "")[2:6].lower() for plate in plates]
+        updates = [(plate, "", generator.expiry(365), "", "") for plate in plates]
+        new_vehicles = list(FleetGenerator(seed + 1, anchor_date).vehicles(size + queries))[size:]
+
+        results["save_or_update_vehicle_insert"] = measure(fleet.save_or_update_vehicle, new_vehicles)
+        results["save_or_update_vehicle_update"] = measure(fleet.save_or_update_vehicle, updates)
+        results["search_by_date"] = measure(fleet.search_by_date, windows)
+        results["search_compliance_events"] = measure(fleet.search_compliance_events, windows)
+        results["fetch_events_page"] = measure(fleet.fetch_events_page, windows)
+        fleet.record_cache.clear()
+        results["search_vehicle_by_number_cold"] = measure(fleet.search_vehicle_by_number, [(p,) for p in plates])
+        results["search_vehicle_by_number_cached"] = measure(fleet.search_vehicle_by_number, [(p,) for p in plates])
+        results["search_trailer_by_number"] = measure(
+            fleet.search_trailer_by_number, [(generator.plate(size + 10 ** 6 - 1 - i % size),) for i in range(queries)])
+        results["search_plates"] = measure(fleet.search_plates, [(text,) for text in partial_plates])
+        results["plan_workshop"] = measure(partial(fleet.plan_workshop, today=anchor_date), [() for _ in range(5)])
+        fleet.get_repository().close()
+    return results
+
+
+# Нагрузочный тест режима сервера: каждый поток — диспетчер, который ищет и сохраняет без пауз
+def run_load_test(sessions, duration, size, seed, write_share=LOAD_TEST_WRITE_SHARE, anchor_date=ANCHOR_DATE):
+    generator = FleetGenerator(seed, anchor_date)
+    with tempfile.TemporaryDirectory() as directory:
+        fleet.use_database(os.path.join(directory, "load_test.db"), pool_size=fleet.SERVER_POOL_SIZE,
+                           single_writer=True)
+        fleet.init_db()
+        load_fleet(generator, size)
+        latencies = {"read": [], "write": []}
+        errors = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def dispatcher(number):
+            rnd = random.Random(seed + number)
+            local_latencies = {"read": [], "write": []}
+            local_errors = []
+            while time.perf_counter() < deadline:
+                plate = generator.plate(rnd.randrange(size))
+                if rnd.random() < write_share:
+                    kind = "write"
+                    due = (generator.today + timedelta(days=rnd.randint(0, 365))).strftime("%d/%m/%Y")
+                    call, arguments = fleet.save_or_update_vehicle, (plate, "", due, "", "")
+                else:
+                    kind = "read"
+                    call, arguments = rnd.choice((
+                        (fleet.search_vehicle_by_number, (plate,)),
+                        (fleet.search_plates, (plate.replace(" ", "")[2:6],)),
+                        (fleet.fetch_events_page, generator.date_window()),
+                    ))
+                started = time.perf_counter()
+                try:
+                    call(*arguments)
+                except sqlite3.Error as error:
+                    local_errors.append(str(error))
+                local_latencies[kind].append(time.perf_counter() - started)
+            with lock:
+                for kind, values in local_latencies.items():
+                    latencies[kind].extend(values)
+                errors.extend(local_errors)
+
+        threads = [threading.Thread(target=dispatcher, args=(number,)) for number in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        fleet.get_repository().close()
+
+    return {
+        "sessions": sessions,
+        "seconds": duration,
+        "assets": 2 * size,
+        "read": summarize(latencies["read"]) if latencies["read"] else None,
+        "write": summarize(latencies["write"]) if latencies["write"] else None,
+        "operations_per_second": (len(latencies["read"]) + len(latencies["write"])) / duration,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:10],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark funkcji danych Management vehicles")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="liczba pojazdów (i tyle samo przyczep) w kolejnych przebiegach, np. 10000 100000 1000000")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="liczba zapytań na funkcję")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--anchor-date", type=date.fromisoformat, default=ANCHOR_DATE,
+                        help="data odniesienia floty (RRRR-MM-DD), od której liczone są terminy")
+    parser.add_argument("--output", default="bench_results.json", help="plik JSON z wynikami")
+    parser.add_argument("--load-test", type=int, metavar="SESSIONS",
+                        help="zamiast pomiaru funkcji uruchom test obciążenia z podaną liczbą jednoczesnych sesji")
+    parser.add_argument("--duration", type=int, default=LOAD_TEST_SECONDS, help="czas testu obciążenia w sekundach")
+    parser.add_argument("--fleet-size", type=int, default=LOAD_TEST_SIZE,
+                        help="liczba pojazdów (i przyczep) w teście obciążenia")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "anchor_date": args.anchor_date.isoformat(),
+        "queries": args.queries,
+        "results": {},
+    }
+    if args.load_test:
+        result = run_load_test(args.load_test, args.duration, args.fleet_size, args.seed,
+                               anchor_date=args.anchor_date)
+        report["load_test"] = result
+        print(f"Sesje: {result['sessions']}, operacje/s: {result['operations_per_second']:.0f}, "
+              f"błędy: {result['errors']}")
+        for kind in ("read", "write"):
+            if result[kind]:
+                print(f"  {kind:6} p50 {result[kind]['p50_ms']:8.3f} ms  p99 {result[kind]['p99_ms']:8.3f} ms")
+        args.sizes = []
+
+    for size in args.sizes:
+        print(f"Rozmiar floty: {size} pojazdów + {size} przyczep")
+        report["results"][str(size)] = run_size(size, args.queries, args.seed, args.anchor_date)
+        for name, stats in report["results"][str(size)].items():
+            if "p50_ms" in stats:
+                print(f"  {name:35} p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms  "
+                      f"{stats['ops_per_second']:10.0f} op/s")
+            else:
+                print(f"  {name:35} {stats['rows_per_second']:10.0f} wierszy/s")
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wyniki zapisano w {args.output}")
+
+
+if __name__ == "__main__":
+    main()
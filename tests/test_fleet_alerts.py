@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("flet")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Management_vehicles_FLET_app as fleet  # noqa: E402
+
+TODAY = "2026-10-18"
+
+
+def entries(due_date, since):
+    scheduler = fleet.ExpiryAlertScheduler((30, 7, 1))
+    return sorted(scheduler._entries(("vehicle", "WGM 1", "insurance", due_date), TODAY, since))
+
+
+def test_future_leads_are_queued_on_their_day():
+    assert entries("2026-10-23", TODAY) == [("2026-10-22", "2026-10-23", "vehicle", "WGM 1", "insurance", 1)]
+
+
+def test_leads_missed_since_last_run_collapse_into_one_alert_today():
+    assert entries("2026-10-23", "2026-10-14") == [
+        ("2026-10-18", "2026-10-23", "vehicle", "WGM 1", "insurance", 5),
+        ("2026-10-22", "2026-10-23", "vehicle", "WGM 1", "insurance", 1),
+    ]
+
+
+def test_leads_before_last_run_are_not_repeated():
+    assert entries("2026-10-23", "2026-10-17") == [("2026-10-22", "2026-10-23", "vehicle", "WGM 1", "insurance", 1)]
+
+
+def test_lead_falling_today_is_delivered_once_per_day():
+    assert entries("2026-10-25", "2026-10-17")[0] == ("2026-10-18", "2026-10-25", "vehicle", "WGM 1", "insurance", 7)
+    assert entries("2026-10-25", TODAY) == [("2026-10-24", "2026-10-25", "vehicle", "WGM 1", "insurance", 1)]
+
+
+def test_malformed_due_date_is_skipped():
+    assert entries("1/2/2027", None) == []
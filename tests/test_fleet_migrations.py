@@ -0,0 +1,60 @@
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("flet")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Management_vehicles_FLET_app as fleet  # noqa: E402
+
+
+@pytest.fixture
+def legacy_database(tmp_path):
+    path = tmp_path / "data_base.db"
+    conn = sqlite3.connect(path)
+    conn.execute(fleet.CREATE_VEHICLES_SQL)
+    conn.execute(fleet.CREATE_TRAILERS_SQL)
+    conn.executemany(
+        "INSERT INTO vehicles (vehicle_number, insurance_number, insurance_expiry, inspection_expiry, "
+        "tachograph_calibration) VALUES (?, ?, ?, ?, ?)",
+        [("WGM 1234", "POL/1", "01/02/2027", "01/03/2027", ""),
+         ("PO 5555", "POL/2", "05/06/2027", "", ""),
+         ("wgm-1234", "POL/3", "02/02/2027", "02/03/2027", "")])
+    conn.executemany(
+        "INSERT INTO trailers (trailer_number, trailer_insurance_number, trailer_insurance_expiry, "
+        "trailer_inspection_expiry) VALUES (?, ?, ?, ?)",
+        [("KR 7", "POL/4", "", ""), ("KR7", "POL/5", "", "")])
+    conn.commit()
+    conn.close()
+    fleet.use_database(str(path))
+    yield path
+    fleet.get_repository().close()
+
+
+def test_duplicate_plates_are_quarantined(legacy_database):
+    fleet.init_db()
+    with fleet.get_repository().connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == fleet.MIGRATIONS[-1][0]
+        vehicles = conn.execute("SELECT vehicle_number, insurance_number FROM vehicles ORDER BY id").fetchall()
+        trailers = conn.execute("SELECT trailer_number FROM trailers").fetchall()
+        quarantined = conn.execute("SELECT table_name, asset_number, row_data FROM duplicate_plates "
+                                   "ORDER BY table_name").fetchall()
+        events = conn.execute("SELECT asset_number, due_date FROM compliance_events "
+                              "WHERE event_kind = 'insurance' ORDER BY asset_number").fetchall()
+    assert vehicles == [("PO 5555", "POL/2"), ("wgm-1234", "POL/3")]
+    assert trailers == [("KR7",)]
+    assert [(table, number) for table, number, _ in quarantined] == [("trailers", "KR 7"), ("vehicles", "WGM 1234")]
+    assert json.loads(quarantined[1][2])["insurance_number"] == "POL/1"
+    assert events == [("PO 5555", "2027-06-05"), ("wgm-1234", "2027-02-02")]
+    assert [row[1] for row in fleet.search_vehicle_by_number("WGM1234")] == ["wgm-1234"]
+
+
+def test_migrations_are_idempotent(legacy_database):
+    fleet.init_db()
+    fleet.init_db()
+    with fleet.get_repository().connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM duplicate_plates").fetchone()[0] == 2
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("flet")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Management_vehicles_FLET_app as fleet  # noqa: E402
+
+EVENT_KINDS = {"all": None, "inspection": ["inspection"], "insurance_tachograph": ["insurance", "tachograph"]}
+
+
+@pytest.fixture
+def database(tmp_path):
+    fleet.use_database(str(tmp_path / "data_base.db"))
+    fleet.init_db()
+    fleet.save_many_vehicles([("WGM 1", "POL/1", "10/01/2027", "20/03/2027", ""),
+                              ("PO 2", "POL/2", "10/05/2027", "15/01/2027", "")])
+    fleet.save_many_trailers([("KR 3", "POL/3", "31/01/2027", "")])
+    yield
+    fleet.get_repository().close()
+
+
+@pytest.mark.parametrize("event_kinds", EVENT_KINDS.values(), ids=EVENT_KINDS.keys())
+@pytest.mark.parametrize("asset_type", fleet.ASSET_TABLES)
+def test_search_by_date_is_driven_by_due_date(database, asset_type, event_kinds):
+    table, number_column, _ = fleet.ASSET_TABLES[asset_type]
+    condition, parameters = fleet._events_filter("01/01/2027", "31/01/2027", event_kinds)
+    sql = fleet.SEARCH_BY_DATE_SQL.format(table=table, number_column=number_column, condition=condition)
+    with fleet.get_repository().connection() as conn:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", [asset_type, *parameters])]
+    events_steps = [step for step in plan if "compliance_events" in step]
+    assert events_steps, plan
+    for step in events_steps:
+        assert step.startswith("SEARCH compliance_events USING"), plan
+        assert "due_date>?" in step and "asset_type" not in step, plan
+
+
+def test_search_by_date_results(database):
+    vehicles, trailers = fleet.search_by_date("01/01/2027", "31/01/2027")
+    assert sorted(row[1] for row in vehicles) == ["PO 2", "WGM 1"]
+    assert [row[1] for row in trailers] == ["KR 3"]
+    vehicles, trailers = fleet.search_by_date("01/01/2027", "31/01/2027", ["inspection"])
+    assert [row[1] for row in vehicles] == ["PO 2"]
+    assert trailers == []
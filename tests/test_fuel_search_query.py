@@ -0,0 +1,52 @@
+import importlib
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PySide6.QtWidgets")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+FILTERS = {
+    "vehicle": dict(vehicle_number="WGM1234"),
+    "card": dict(fuel_card="7077-01"),
+    "dates": dict(start_date="2024-01-01", end_date="2024-03-31"),
+    "vehicle_dates": dict(vehicle_number="WGM1234", start_date="2024-01-01", end_date="2024-03-31"),
+    "card_dates": dict(fuel_card="7077-01", start_date="2024-01-01", end_date="2024-03-31"),
+    "all": dict(vehicle_number="WGM1234", fuel_card="7077-01", start_date="2024-01-01", end_date="2024-03-31"),
+}
+
+
+@pytest.fixture(params=["APP_PL", "APP_RU"])
+def app(request, tmp_path, monkeypatch):
+    module = importlib.import_module(request.param)
+    monkeypatch.setattr(module, "DATABASE_FILE", str(tmp_path / "fuel_data.db"))
+    module.create_database()
+    return module
+
+
+def query_plan(app, query, parameters):
+    conn = sqlite3.connect(app.DATABASE_FILE)
+    try:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", parameters)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("filters", FILTERS.values(), ids=FILTERS.keys())
+@pytest.mark.parametrize("order_by", [None, "fuel_date"])
+def test_search_uses_index(app, filters, order_by):
+    plan = query_plan(app, *app.build_search_query(**filters, order_by=order_by))
+    table_steps = [step for step in plan if "refueling_data" in step]
+    assert table_steps, plan
+    for step in table_steps:
+        assert step.startswith("SEARCH refueling_data USING"), plan
+        assert "INDEX" in step, plan
+
+
+def test_unknown_sort_column_rejected(app):
+    with pytest.raises(ValueError):
+        app.build_search_query(order_by="id; DROP TABLE refueling_data")